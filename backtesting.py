@@ -0,0 +1,71 @@
+# Backtesting con origen móvil para los modelos de pronóstico de ingresos diarios.
+# Cada pliegue entrena con los días hasta un origen y compara el pronóstico de los días siguientes
+# con lo vendido; los pliegues son independientes y los de modelos pesados pueden repartirse en el
+# pool de procesos compartido de forecasting.
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
+import forecasting
+
+
+def trend_model(panel: pd.DataFrame, horizon: int) -> pd.DataFrame:
+    return forecasting.forecast_trend(panel, horizon)
+
+
+def ets_model(panel: pd.DataFrame, horizon: int) -> pd.DataFrame:
+    return forecasting.forecast_ets(panel, horizon)
+
+
+# Modelos evaluables: función (panel de entrenamiento, horizonte) -> pred_df con 'Serie' y 'Fecha'
+MODELS = {
+    'trend': trend_model,
+    'ets': ets_model,
+}
+
+# Modelos cuyos pliegues cuestan lo suficiente para repartirlos en procesos; la tendencia es un
+# mínimo cuadrado chico por pliegue y en serie termina antes de que arranque el primer proceso
+PARALLEL_MODELS = {'ets'}
+
+
+def run_fold(model: str, panel: pd.DataFrame, cutoff: int, horizon: int) -> pd.DataFrame:
+    train = panel.iloc[:cutoff]
+    origin = pd.Timestamp(train.index[-1])
+    forecast = MODELS[model](train, horizon)
+    # Solo se evalúan los días del horizonte que tuvieron ventas; los días cerrados no tienen observación
+    actual = panel.iloc[cutoff:].stack().rename('Real').reset_index()
+    actual.columns = ['Fecha', 'Serie', 'Real']
+    fold = forecast.merge(actual, on=['Fecha', 'Serie'], how='inner')
+    fold['Horizonte'] = (fold['Fecha'] - origin).dt.days
+    fold['Origen'] = origin
+    return fold[['Origen', 'Serie', 'Fecha', 'Horizonte', 'Total', 'Real']]
+
+
+def backtest(panel: pd.DataFrame, model: str = 'trend', horizon: int = 7, min_train: int = 14,
+             step: int = 1, workers: int = None) -> pd.DataFrame:
+    """Validación cruzada con origen móvil; devuelve un pronóstico por (origen, serie, fecha)."""
+    panel = panel.sort_index()
+    dates = pd.to_datetime(panel.index)
+    cutoffs = [cutoff for cutoff in range(max(min_train, 2), len(panel), step)]
+    # Cada pliegue recibe solo las filas que necesita: entrenamiento más su ventana de evaluación
+    ends = np.searchsorted(dates, dates[[cutoff - 1 for cutoff in cutoffs]] + pd.Timedelta(days=horizon), side='right')
+    slices = [panel.iloc[:end] for end in ends]
+    folds = forecasting.parallel_map(run_fold, repeat(model, len(cutoffs)), slices, cutoffs, repeat(horizon, len(cutoffs)),
+                                     workers=workers if model in PARALLEL_MODELS else None)
+    if not folds:
+        return pd.DataFrame(columns=['Origen', 'Serie', 'Fecha', 'Horizonte', 'Total', 'Real'])
+    return pd.concat(folds, ignore_index=True)
+
+
+def horizon_metrics(folds: pd.DataFrame) -> pd.DataFrame:
+    # MAPE ignora los días con venta real en cero, donde el error porcentual no está definido
+    error = folds['Total'] - folds['Real']
+    pct = (error.abs() / folds['Real'].abs()).where(folds['Real'] != 0)
+    scores = pd.DataFrame({'Horizonte': folds['Horizonte'], 'ape': pct, 'se': error ** 2})
+    grouped = scores.groupby('Horizonte')
+    return pd.DataFrame({
+        'MAPE (%)': grouped['ape'].mean() * 100,
+        'RMSE': np.sqrt(grouped['se'].mean()),
+        'Pronósticos': grouped.size()
+    }).reset_index()
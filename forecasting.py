@@ -0,0 +1,236 @@
+# Pronóstico por lotes de muchas series diarias (productos, centros de costos, grupos de clientes).
+# Todas las series comparten el calendario de días con ventas, así que la tendencia de todas se
+# ajusta con un único problema de mínimos cuadrados con una columna de respuesta por serie.
+import hashlib
+import multiprocessing
+import threading
+import warnings
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+
+# Pool de procesos compartido por los pronósticos y el backtesting: se crea una sola vez por proceso
+# y se reutiliza entre llamadas. 'spawn' evita heredar los hilos del servidor de Streamlit al crear los
+# procesos, pero arrancarlos cuesta segundos, así que solo se usa con suficientes tareas pesadas.
+PARALLEL_MIN_TASKS = 64
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+
+def process_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _pool_workers = workers
+        return _pool
+
+
+def reset_pool():
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool, _pool_workers = None, None
+
+
+def parallel_map(func, *iterables, workers: int = None, min_tasks: int = PARALLEL_MIN_TASKS) -> list:
+    """``map`` en el pool compartido cuando hay ``workers`` > 1 y al menos ``min_tasks`` tareas; si no, en serie."""
+    iterables = [list(values) for values in iterables]
+    n_tasks = len(iterables[0]) if iterables else 0
+    if not workers or workers < 2 or n_tasks < max(min_tasks, 2):
+        return list(map(func, *iterables))
+    chunksize = max(1, n_tasks // (workers * 4))
+    try:
+        return list(process_pool(workers).map(func, *iterables, chunksize=chunksize))
+    except BrokenProcessPool:
+        # Un proceso murió (p. ej. por memoria): el pool se descarta y se reintenta con uno nuevo
+        reset_pool()
+        return list(process_pool(workers).map(func, *iterables, chunksize=chunksize))
+
+
+def stack_series(totals: pd.Series) -> pd.DataFrame:
+    # Serie con índice (Fecha, clave) -> matriz días × series; un día sin ventas de una serie cuenta como cero
+    panel = totals.unstack(fill_value=0).sort_index()
+    panel.columns = panel.columns.astype(str)
+    return panel
+
+
+def pred_frame(keys, dates: pd.DatetimeIndex, mean: np.ndarray, lower: np.ndarray, upper: np.ndarray) -> pd.DataFrame:
+    # Mismo formato que el pred_df del tablero, con una columna 'Serie' adicional (horizonte × series -> largo)
+    horizon, n_series = mean.shape
+    return pd.DataFrame({
+        'Serie': np.repeat(np.asarray(keys, dtype=object), horizon),
+        'Fecha': np.tile(dates.to_numpy(), n_series),
+        'Total': mean.T.ravel(),
+        'Lower': np.maximum(lower.T.ravel(), 0),  # Evitar valores negativos
+        'Upper': np.maximum(upper.T.ravel(), 0),
+        'Tipo': 'Predicción'
+    })
+
+
+def future_dates(dates: pd.DatetimeIndex, horizon: int) -> pd.DatetimeIndex:
+    return dates[-1] + pd.to_timedelta(np.arange(1, horizon + 1), unit='D')
+
+
+def panel_fingerprint(panel: pd.DataFrame) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((panel.shape, list(panel.columns))).encode('utf-8'))
+    digest.update(pd.to_datetime(panel.index).to_numpy().astype('datetime64[ns]').tobytes())
+    digest.update(np.ascontiguousarray(panel.to_numpy(dtype=float)).tobytes())
+    return digest.hexdigest()
+
+
+class TrendStats:
+    """Estadísticas suficientes (XᵀX, XᵀY, Σy²) de una tendencia polinómica ajustada a varias series.
+
+    Agregar días al final solo suma la contribución de las filas nuevas; el ajuste se resuelve
+    a partir de estas matrices sin volver a recorrer el historial.
+    """
+
+    def __init__(self, origin, degree: int, columns):
+        self.origin = pd.Timestamp(origin)
+        self.degree = degree
+        self.columns = list(columns)
+        n_params = degree + 1
+        self.xtx = np.zeros((n_params, n_params))
+        self.xty = np.zeros((n_params, len(self.columns)))
+        self.yty = np.zeros(len(self.columns))
+        self.n_obs = 0
+        self.last_day = None
+        self.fingerprint = None
+
+    def covers_prefix(self, panel: pd.DataFrame) -> bool:
+        # Las filas ya absorbidas deben seguir siendo el comienzo exacto de la serie
+        return (list(panel.columns) == self.columns and len(panel) >= self.n_obs
+                and pd.Timestamp(panel.index[0]) == self.origin
+                and panel_fingerprint(panel.iloc[:self.n_obs]) == self.fingerprint)
+
+    def extend(self, panel: pd.DataFrame) -> 'TrendStats':
+        # Devuelve un ajuste nuevo con las filas posteriores a las ya absorbidas; el original no cambia
+        updated = TrendStats(self.origin, self.degree, self.columns)
+        rows = panel.iloc[self.n_obs:]
+        days = (pd.to_datetime(rows.index) - self.origin).days.to_numpy(dtype=float)
+        X = np.vander(days, self.degree + 1, increasing=True)
+        Y = rows.to_numpy(dtype=float)
+        updated.xtx = self.xtx + X.T @ X
+        updated.xty = self.xty + X.T @ Y
+        updated.yty = self.yty + (Y ** 2).sum(axis=0)
+        updated.n_obs = len(panel)
+        updated.last_day = days[-1] if len(days) else self.last_day
+        updated.fingerprint = panel_fingerprint(panel)
+        return updated
+
+    def forecast(self, horizon: int = 7, alpha: float = 0.05) -> pd.DataFrame:
+        n_params = self.degree + 1
+        xtx_inv = np.linalg.pinv(self.xtx)
+        coef = xtx_inv @ self.xty
+        # Suma de residuos al cuadrado desde las ecuaciones normales: y'y - b'X'y
+        rss = np.maximum(self.yty - (coef * self.xty).sum(axis=0), 0)
+        dof = self.n_obs - n_params
+        sigma2 = rss / dof if dof > 0 else np.full(len(self.columns), np.nan)
+
+        F = np.vander(self.last_day + np.arange(1, horizon + 1), n_params, increasing=True)
+        mean = F @ coef
+        # Varianza de la media pronosticada: sigma² · f (X'X)⁻¹ f', la misma matriz para todas las series
+        leverage = np.einsum('ij,jk,ik->i', F, xtx_inv, F)
+        se = np.sqrt(np.outer(leverage, sigma2))
+        q = stats.t.ppf(1 - alpha / 2, dof) if dof > 0 else np.nan
+        dates = self.origin + pd.to_timedelta(self.last_day + np.arange(1, horizon + 1), unit='D')
+        return pred_frame(self.columns, dates, mean, mean - q * se, mean + q * se)
+
+
+def forecast_trend(panel: pd.DataFrame, horizon: int = 7, degree: int = 1, alpha: float = 0.05) -> pd.DataFrame:
+    """Tendencia polinómica (grado 1 = la regresión lineal del tablero) para todas las columnas a la vez.
+
+    Las bandas son el intervalo de confianza de la media, como ``OLS.get_prediction().conf_int()``.
+    """
+    return TrendStats(panel.index[0], degree, panel.columns).extend(panel).forecast(horizon, alpha)
+
+
+def fit_ets(values: np.ndarray, horizon: int, alpha: float) -> tuple:
+    # Modelo más pesado (ETS aditivo con tendencia amortiguada) para una sola serie; se ejecuta en los procesos del pool
+    from statsmodels.tsa.exponential_smoothing.ets import ETSModel
+
+    series = pd.Series(values)
+    if len(series) < 4 or not series.any():
+        level = np.full(horizon, series.mean() if len(series) else 0.0)
+        return level, level, level
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            result = ETSModel(series, error='add', trend='add', damped_trend=True).fit(disp=False)
+            frame = result.get_prediction(start=len(series), end=len(series) + horizon - 1).summary_frame(alpha=alpha)
+        return frame['mean'].to_numpy(), frame['pi_lower'].to_numpy(), frame['pi_upper'].to_numpy()
+    except Exception:
+        level = np.full(horizon, series.mean())
+        return level, level, level
+
+
+def forecast_ets(panel: pd.DataFrame, horizon: int = 7, alpha: float = 0.05, workers: int = None) -> pd.DataFrame:
+    """ETS por serie; con ``workers`` > 1 y muchas series, las series se reparten en el pool compartido."""
+    columns = [panel[col].to_numpy(dtype=float) for col in panel.columns]
+    results = parallel_map(fit_ets, columns, repeat(horizon, len(columns)), repeat(alpha, len(columns)), workers=workers)
+
+    mean, lower, upper = (np.column_stack([result[i] for result in results]) for i in range(3))
+    return pred_frame(panel.columns, future_dates(pd.to_datetime(panel.index), horizon), mean, lower, upper)
+
+
+class ModelCache:
+    """Pronósticos por huella de la serie y especificación del modelo.
+
+    Para la tendencia también conserva las estadísticas suficientes del último ajuste de cada
+    serie, de modo que una serie que solo ganó días al final se actualiza en lugar de reajustarse.
+    """
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self._forecasts = OrderedDict()
+        self._fits = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, entries: OrderedDict, key):
+        with self._lock:
+            value = entries.get(key)
+            if value is not None:
+                entries.move_to_end(key)
+            return value
+
+    def _put(self, entries: OrderedDict, key, value):
+        with self._lock:
+            entries[key] = value
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def trend(self, panel: pd.DataFrame, horizon: int = 7, degree: int = 1, alpha: float = 0.05) -> pd.DataFrame:
+        key = ('trend', degree, horizon, alpha, panel_fingerprint(panel))
+        forecast = self._get(self._forecasts, key)
+        if forecast is not None:
+            return forecast
+        fit_key = (degree, tuple(panel.columns), pd.Timestamp(panel.index[0]))
+        fit = self._get(self._fits, fit_key)
+        if fit is None or not fit.covers_prefix(panel):
+            fit = TrendStats(panel.index[0], degree, panel.columns)
+        fit = fit.extend(panel)
+        forecast = fit.forecast(horizon, alpha)
+        self._put(self._fits, fit_key, fit)
+        self._put(self._forecasts, key, forecast)
+        return forecast
+
+    def ets(self, panel: pd.DataFrame, horizon: int = 7, alpha: float = 0.05, workers: int = None) -> pd.DataFrame:
+        key = ('ets', horizon, alpha, panel_fingerprint(panel))
+        forecast = self._get(self._forecasts, key)
+        if forecast is None:
+            forecast = forecast_ets(panel, horizon, alpha, workers)
+            self._put(self._forecasts, key, forecast)
+        return forecast
@@ -3,30 +3,37 @@ import pandas as pd
 import plotly.express as px
 from datetime import datetime, timedelta
 import io
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Image
-from reportlab.lib.styles import getSampleStyleSheet
-import xlsxwriter
 from sklearn.linear_model import LinearRegression
 import numpy as np
-import statsmodels.api as sm
 import os
-import plotly.io as pio
+import random
+import hashlib
+import logging
+import forecasting
+from sales_core import (
+    CONFIG, ArtifactCache, PngRenderer, FilterIndex, DateIndex, SalesCube, frame_fingerprint, build_pdf, build_excel,
+    category_options, sort_positions, raw_data_page, daily_panel, forecast_panel, backtest_metrics,
+    find_duplicates, duplicate_report, dataset_bounds, overlapping_months, read_manifest, read_dataset, read_cube,
+    audit_history, load_dataset, build_selections, select_rows, client_sales_table, summary_table,
+    SpanRecorder, MetricsSink, span, logger as core_logger
+)
 
 # Función auxiliar para generar botones de descarga y reset de gráficas
 def add_graph_controls(fig, fig_name):
     col1, col2 = st.columns(2)
     with col1:
-        # Botón de descarga como PNG
+        # Botón de descarga como PNG: se renderiza solo al pedirlo y se guarda por huella del JSON de la figura
         try:
             if fig is not None and fig.data:  # Verificar que la gráfica sea válida
-                img_bytes = pio.to_image(fig, format="png", scale=2)
-                st.download_button(
-                    label="Descargar Gráfica (PNG)",
-                    data=img_bytes,
+                fig_json = fig.to_json()
+                fig_key = hashlib.blake2b(fig_json.encode('utf-8'), digest_size=16).hexdigest()
+                deferred_download(
+                    "Descargar Gráfica (PNG)",
+                    lambda: render_png(fig_json, fig_key),
                     file_name=f"{fig_name}.png",
-                    mime="image/png"
+                    mime="image/png",
+                    key=f"png_{fig_name}",
+                    data_key=fig_key
                 )
             else:
                 st.warning(f"No se pudo generar la imagen para '{fig_name}'. La gráfica está vacía o no es válida.")
@@ -42,170 +49,185 @@ def add_graph_controls(fig, fig_name):
                 )
                 st.rerun()
 
-# Funciones auxiliares
-def generate_pdf(data: pd.DataFrame, title: str, filename: str, _data_hash: str) -> io.BytesIO:
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    elements = []
-    styles = getSampleStyleSheet()
+# Series largas: reducción de puntos en el servidor (LTTB) y trazas WebGL por encima del umbral
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    # Largest-Triangle-Three-Buckets: conserva la forma visual (picos y valles) con n_out puntos
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.intp)
+    selected = np.empty(n_out, dtype=np.intp)
+    selected[0], selected[-1] = 0, n - 1
+    anchor = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[end:next_end].mean(), y[end:next_end].mean()
+        area = np.abs((x[anchor] - avg_x) * (y[start:end] - y[anchor]) - (x[anchor] - x[start:end]) * (avg_y - y[anchor]))
+        anchor = start + int(np.argmax(area))
+        selected[i + 1] = anchor
+    return selected
 
-    try:
-        logo = Image("app/data/logo.png", width=100, height=50)
-        elements.append(logo)
-    except Exception as e:
-        elements.append(Paragraph("Logo no disponible", styles['Normal']))
-
-    elements.append(Paragraph(title, styles['Title']))
-    elements.append(Paragraph(" ", styles['Normal']))
-
-    data_list = [data.columns.tolist()] + data.values.tolist()
-    table = Table(data_list)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-    ]))
-    elements.append(table)
-    doc.build(elements)
-    buffer.seek(0)
-    return buffer
+def downsample_series(data: pd.DataFrame, x: str, y: str, color: str = None) -> pd.DataFrame:
+    # Tantos puntos por serie como píxeles tiene el ancho del gráfico
+    max_points = CONFIG['charts']['pixel_width'] * CONFIG['charts']['points_per_pixel']
+    groups = [data] if color is None else [group for _, group in data.groupby(color, observed=True, sort=False)]
+    if all(len(group) <= max_points for group in groups):
+        return data
+    parts = []
+    for group in groups:
+        group = group.sort_values(x, kind='stable')
+        x_values = pd.to_datetime(group[x]).to_numpy().astype('datetime64[ns]').view('int64').astype(float) \
+            if not pd.api.types.is_numeric_dtype(group[x]) else group[x].to_numpy(dtype=float)
+        parts.append(group.iloc[lttb_indices(x_values, group[y].to_numpy(dtype=float), max_points)])
+    return pd.concat(parts)
+
+def line_chart(data: pd.DataFrame, x: str, y: str, color: str = None, **kwargs):
+    data = downsample_series(data, x, y, color)
+    render_mode = 'webgl' if len(data) > CONFIG['charts']['webgl_threshold'] else 'svg'
+    return px.line(data, x=x, y=y, color=color, render_mode=render_mode, **kwargs)
+
+# Descarga diferida: el archivo solo se genera cuando el usuario lo solicita
+def deferred_download(label, build, file_name, mime, key, data_key):
+    state_key = f"export_{key}"
+    ready = st.session_state.get(state_key)
+    if ready is None or ready[0] != data_key:
+        if not st.button(TRANSLATIONS[lang_code]['prepare_download'].format(label=label), key=f"prepare_{key}"):
+            return
+        with st.spinner(TRANSLATIONS[lang_code]['generating_file'].format(file=file_name)):
+            data = build()
+            ready = (data_key, data.getvalue() if isinstance(data, io.BytesIO) else data)
+        st.session_state[state_key] = ready
+    st.download_button(label, data=ready[1], file_name=file_name, mime=mime, key=f"download_{key}")
+
+# Las funciones de análisis viven en sales_core; aquí solo se envuelven con las cachés de Streamlit
+@st.cache_resource
+def get_artifact_cache() -> ArtifactCache:
+    return ArtifactCache(CONFIG['exports']['cache_max_bytes'])
+
+@st.cache_resource
+def get_png_renderer() -> PngRenderer:
+    return PngRenderer(CONFIG['exports']['png_workers'])
+
+def render_png(fig_json: str, fig_key: str) -> bytes:
+    cache = get_artifact_cache()
+    key = ('png', fig_key)
+    data = cache.get(key)
+    if data is None:
+        renderer = get_png_renderer()
+        with span('export_png'):
+            # Sin el servidor de Kaleido, exportación directa de plotly; sin Chrome su error llega al aviso del botón
+            data = renderer.render(fig_json) if renderer.warm else renderer.render_once(fig_json)
+        cache.put(key, data)
+    return data
+
+def generate_pdf(data: pd.DataFrame, title: str, filename: str, _data_hash: str) -> io.BytesIO:
+    cache = get_artifact_cache()
+    key = ('pdf', _data_hash or frame_fingerprint(data), title)
+    pdf_bytes = cache.get(key)
+    if pdf_bytes is None:
+        with span('export_pdf', archivo=filename):
+            pdf_bytes = build_pdf(data, title)
+        cache.put(key, pdf_bytes)
+    return io.BytesIO(pdf_bytes)
 
 def generate_excel(data: pd.DataFrame, sheet_name: str, _data_hash: str) -> io.BytesIO:
-    buffer = io.BytesIO()
-    with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
-        data.to_excel(writer, sheet_name=sheet_name, index=False)
-        workbook = writer.book
-        worksheet = writer.sheets[sheet_name]
-        header_fmt = workbook.add_format({'bold': True, 'bg_color': '#D3D3D3'})
-        for col_num, value in enumerate(data.columns.values):
-            worksheet.write(0, col_num, value, header_fmt)
-        worksheet.autofit()
-    buffer.seek(0)
-    return buffer
+    cache = get_artifact_cache()
+    key = ('xlsx', _data_hash or frame_fingerprint(data), sheet_name)
+    xlsx_bytes = cache.get(key)
+    if xlsx_bytes is None:
+        with span('export_excel', hoja=sheet_name):
+            xlsx_bytes = build_excel(data, sheet_name)
+        cache.put(key, xlsx_bytes)
+    return io.BytesIO(xlsx_bytes)
 
-def load_data():
-    def load_excel():
-        try:
-            df = pd.read_excel("app/data/Órdenes del punto de venta (pos.order).xlsx", engine='openpyxl')
-            return df
-        except Exception as e:
-            st.error(f"Error al cargar los datos: {str(e)}")
-            return pd.DataFrame()
-
-    def validate_data(df):
-        required_cols = ['Cliente/Código de barras', 'Cliente/Nombre', 'Centro de Costos Aseavna', 'Fecha', 'Número de recibo', 
-                        'Cliente/Nombre principal', 'Precio total colaborador', 'Comision Aseavna', 'Cuentas por a cobrar aseavna', 
-                        'Cuentas por a Cobrar Avna', 'Ventas Totales', 'Líneas de la orden', 'Líneas de la orden/Cantidad']
-        missing_cols = [col for col in required_cols if col not in df.columns]
-        if missing_cols:
-            st.error(f"Faltan las columnas: {', '.join(missing_cols)}")
-            return False
-        return True
-
-    def map_columns(df):
-        df_columns = {col.strip().lower(): col for col in df.columns}
-        for expected_col, search_col in CONFIG['columns'].items():
-            found_col = next((col for col_name, col in df_columns.items() if col_name == search_col.strip().lower()), None)
-            df[expected_col] = df[found_col] if found_col else ('Desconocido' if 'Cliente' in expected_col or 'Líneas' in expected_col else 0)
-        return df
-
-    def calculate_total(df):
-        # Calcular Total Final como suma de Cuentas por a cobrar aseavna y Cuentas por a Cobrar Avna
-        df['Total Final'] = pd.to_numeric(df['Cuentas por a cobrar aseavna'], errors='coerce').fillna(0) + \
-                           pd.to_numeric(df['Cuentas por a Cobrar Avna'], errors='coerce').fillna(0)
-        return df
-
-    def clean_data(df):
-        defaults = {
-            'Cliente/Código de barras': 'Desconocido',
-            'Cliente/Nombre': 'Desconocido',
-            'Centro de Costos Aseavna': 'Desconocido',
-            'Cliente/Nombre principal': 'Desconocido',
-            'Líneas de la orden': 'Desconocido'
-        }
-        for col, default in defaults.items():
-            df[col] = df[col].fillna(default)
-        numeric_cols = ['Líneas de la orden/Cantidad', 'Total Final', 'Comision Aseavna', 'Cuentas por a cobrar aseavna', 
-                       'Cuentas por a Cobrar Avna', 'Precio total colaborador']
-        for col in numeric_cols:
-            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-        if 'Cliente/Nombre' in df.columns:
-            df['Cliente/Nombre'] = df['Cliente/Nombre'].astype(str).str.strip().str.lower()
-        if 'Centro de Costos Aseavna' in df.columns:
-            df['Centro de Costos Aseavna'] = df['Centro de Costos Aseavna'].astype(str).str.strip().str.lower()
-        return df
-
-    def add_day_of_week(df):
-        original_rows = len(df)
-        st.sidebar.write(f"Filas cargadas inicialmente del archivo Excel: {original_rows}")
-
-        if pd.api.types.is_numeric_dtype(df['Fecha']):
-            df['Fecha'] = pd.to_datetime(df['Fecha'], unit='D', origin='1899-12-30', errors='coerce') - timedelta(days=2)
+@st.cache_resource(max_entries=8)
+def get_sort_order(_frame: pd.DataFrame, frame_key: str, column: str, descending: bool):
+    # El orden se calcula una vez por vista y columna; cambiar de página solo corta el arreglo
+    if column is None:
+        return None
+    with span('raw_sort', columna=column):
+        return sort_positions(_frame[column], descending)
+
+@st.cache_resource(max_entries=4)
+def get_sales_cube(dataset_version: str, months: tuple) -> SalesCube:
+    # Las celdas de cada partición se calculan en la ingesta: aquí solo se combinan las del rango
+    with span('build_cube'):
+        return read_cube(read_manifest(), months)
+
+@st.cache_resource(max_entries=4)
+def get_filter_index(_df: pd.DataFrame, dataset_version: str) -> FilterIndex:
+    with span('build_filter_index'):
+        return FilterIndex(_df, CONFIG['filter_dimensions'])
+
+@st.cache_resource(max_entries=4)
+def get_date_index(_df: pd.DataFrame, dataset_version: str) -> DateIndex:
+    return DateIndex(_df['Fecha'])
+
+@st.cache_resource
+def get_model_cache() -> forecasting.ModelCache:
+    return forecasting.ModelCache(CONFIG['forecast']['cache_entries'])
+
+@st.cache_data(persist='disk', max_entries=16, show_spinner=False)
+def backtest_accuracy(dataset_version: str, model: str, horizon: int, min_train: int, _panel: pd.DataFrame) -> pd.DataFrame:
+    # Se calcula una vez por versión del dataset y modelo; los reruns leen el resultado guardado
+    with span('backtest', modelo=model):
+        return backtest_metrics(_panel, model, horizon, min_train)
+
+@st.cache_resource(max_entries=8)
+def load_partitions(dataset_version: str, months: tuple) -> pd.DataFrame:
+    # Solo se abren las particiones mensuales que se solapan con el rango de fechas elegido
+    return read_dataset(read_manifest(), months)
+
+@st.cache_resource(max_entries=4)
+def audit_duplicates(dataset_version: str, products: tuple, window: str, hours) -> pd.DataFrame:
+    with span('audit_history', ventana=window):
+        return audit_history(read_manifest(), list(products), window, hours)
+
+class StreamlitLogHandler(logging.Handler):
+    """Muestra los mensajes de sales_core en la sesión que los produjo."""
+
+    def emit(self, record):
+        message = self.format(record)
+        if record.levelno >= logging.ERROR:
+            st.error(message)
+        elif record.levelno >= logging.WARNING:
+            st.warning(message)
         else:
-            df['Fecha'] = pd.to_datetime(df['Fecha'], format='%Y-%m-%d %H:%M:%S', errors='coerce')
-        
-        df['Fecha_Valida'] = df['Fecha'].notna()
-        invalid_dates = df['Fecha'].isna().sum()
-        if invalid_dates > 0:
-            st.warning(f"Se encontraron {invalid_dates} fechas no válidas que se excluirán del análisis.")
-        
-        duplicates = df.duplicated().sum()
-        if duplicates > 0:
-            st.warning(f"Se encontraron {duplicates} filas duplicadas en el archivo Excel. Se eliminarán.")
-            df = df.drop_duplicates()
-            st.sidebar.write(f"Filas después de eliminar duplicados: {len(df)}")
-        
-        df = df.dropna(subset=['Fecha'])
-        st.sidebar.write(f"Filas después de eliminar fechas no válidas: {len(df)}")
+            st.sidebar.write(message)
 
-        df['Día de la Semana'] = df['Fecha'].dt.day_name()
-        day_translation = {
-            'Monday': 'Lunes', 'Tuesday': 'Martes', 'Wednesday': 'Miércoles',
-            'Thursday': 'Jueves', 'Friday': 'Viernes', 'Saturday': 'Sábado', 'Sunday': 'Domingo'
-        }
-        df['Día de la Semana'] = df['Día de la Semana'].map(day_translation).fillna(df['Día de la Semana'])
-        return df
-
-    df = load_excel()
-    if df.empty or not validate_data(df):
-        return pd.DataFrame()
-    df = map_columns(df)
-    df = calculate_total(df)
-    df = clean_data(df)
-    df = add_day_of_week(df)
-    return df
-
-# Configuración centralizada
-CONFIG = {
-    'columns': {
-        'Cliente/Código de barras': 'Cliente/Código de barras',
-        'Cliente/Nombre': 'Cliente/Nombre',
-        'Centro de Costos Aseavna': 'Centro de Costos Aseavna',
-        'Fecha': 'Fecha',
-        'Número de recibo': 'Número de recibo',
-        'Cliente/Nombre principal': 'Cliente/Nombre principal',
-        'Precio total colaborador': 'Precio total colaborador',
-        'Comision': 'Comision Aseavna',
-        'Cuentas por a cobrar aseavna': 'Cuentas por a cobrar aseavna',
-        'Cuentas por a Cobrar Avna': 'Cuentas por a Cobrar Avna',
-        'Líneas de la orden': 'Líneas de la orden',
-        'Líneas de la orden/Cantidad': 'Líneas de la orden/Cantidad'
-    },
-    'styles': {
-        'metric_box': 'border: 1px solid #d3d3d3; padding: 10px; border-radius: 5px; background-color: white; margin: 5px auto; text-align: center; width: 90%; display: flex; flex-direction: column; justify-content: center; align-items: center;',
-        'alert_box': 'background-color: #ff4d4d; padding: 10px; border-radius: 5px; margin: 10px auto; color: white; text-align: center; width: 90%;'
-    },
-    'colors': {
-        'primary': '#4CAF50',
-        'secondary': '#2c3e50',
-        'warning': '#ffeb3b'
-    }
-}
+@st.cache_resource
+def install_log_handler() -> logging.Handler:
+    # Una sola vez por proceso: cada llamada a st.* se dirige al script que está corriendo en ese hilo
+    handler = StreamlitLogHandler()
+    core_logger.addHandler(handler)
+    core_logger.setLevel(logging.INFO)
+    return handler
+
+def load_data():
+    install_log_handler()
+    with span('ingesta'):
+        return load_dataset()
+
+@st.cache_resource
+def get_metrics_sink() -> MetricsSink:
+    settings = CONFIG['metrics']
+    return MetricsSink(settings['jsonl_path'], settings['prometheus_path'], settings['jsonl_max_bytes'])
+
+def show_performance(recorder: SpanRecorder):
+    # Panel del rerun actual; los mismos spans se agregan al JSONL y al archivo de Prometheus
+    recorder.stop()
+    with st.sidebar.expander(TRANSLATIONS[lang_code]['performance']):
+        if recorder.spans:
+            st.dataframe(recorder.table().style.format({'ms': '{:,.1f}', 'MB': '{:,.2f}'}, na_rep='—'), hide_index=True)
+        if any(entry.get('traced') for entry in recorder.spans):
+            st.caption(TRANSLATIONS[lang_code]['performance_traced_caption'])
+        else:
+            st.caption(TRANSLATIONS[lang_code]['performance_caption'].format(rate=CONFIG['metrics']['memory_sample_rate']))
+    try:
+        get_metrics_sink().publish(recorder)
+    except OSError as e:
+        st.sidebar.write(f"No se pudieron guardar las métricas: {str(e)}")
 
 # Soporte multi-idioma
 TRANSLATIONS = {
@@ -227,7 +249,7 @@ TRANSLATIONS = {
         'visualizations': 'Visualizaciones',
         'export': 'Exportar Resumen',
         'raw_data': 'Datos Crudos',
-        'no_data': 'No se encontraron datos. Asegúrese de que el archivo "Órdenes del punto de venta (pos.order).xlsx" esté disponible en app/data/.',
+        'no_data': 'No se encontraron datos. Asegúrese de que las exportaciones POS (por ejemplo "Órdenes del punto de venta (pos.order).xlsx") estén disponibles en app/data/.',
         'metrics_summary': 'Resumen de Métricas Principales',
         'orders': 'Órdenes Totales',
         'lines': 'Líneas Totales',
@@ -237,8 +259,19 @@ TRANSLATIONS = {
         'top_product': 'Producto Más Vendido',
         'unique_clients': 'Clientes Únicos',
         'daily_sales': 'Resumen de Ingresos Diarios',
-        'duplicates_detected': '⚠️ Se detectaron almuerzos ejecutivos duplicados:',
-        'no_duplicates': '✅ No se detectaron almuerzos ejecutivos duplicados en el mismo día.',
+        'duplicates_detected': '⚠️ Se detectaron duplicados de {products} {window}:',
+        'no_duplicates': '✅ No se detectaron duplicados de {products} {window}.',
+        'dup_message_day': 'en el mismo día',
+        'dup_message_shift': 'en el mismo turno',
+        'dup_message_hours': 'dentro de {hours:g} horas',
+        'dup_message_no_products': 'ningún producto',
+        'dup_products': 'Productos a verificar',
+        'dup_window': 'Ventana de duplicado',
+        'dup_window_day': 'Mismo día',
+        'dup_window_shift': 'Mismo turno',
+        'dup_window_hours': 'Dentro de N horas',
+        'dup_hours': 'Horas de la ventana',
+        'dup_full_history': 'Auditar todo el historial (ignora los filtros)',
         'download_excel': 'Descargar Duplicados (Excel)',
         'download_pdf': 'Descargar Duplicados (PDF)',
         'unusual_sales': '⚠️ Clientes con volumen de consumo inusual:',
@@ -251,6 +284,21 @@ TRANSLATIONS = {
         'no_predictive_data': 'No hay suficientes datos históricos para predicción (se requieren al menos 2 días).',
         'no_monthly_data': 'No hay suficientes datos mensuales para calcular el crecimiento de productos (se requieren al menos dos meses).',
         'predictive_error': 'Error en el análisis predictivo: {error}',
+        'forecast_by': 'Pronosticar por',
+        'forecast_by_total': 'Total',
+        'forecast_by_product': 'Producto',
+        'forecast_by_cost_center': 'Centro de Costos',
+        'forecast_by_client_group': 'Grupo de Clientes',
+        'forecast_model': 'Modelo',
+        'forecast_model_trend': 'Tendencia lineal',
+        'forecast_model_ets': 'Suavizado exponencial (ETS)',
+        'forecast_band_trend': 'intervalo de confianza de la media al {level:.0%}',
+        'forecast_band_ets': 'intervalo de predicción al {level:.0%}',
+        'forecast_series': 'Serie a graficar',
+        'forecast_table': 'Pronósticos por Serie',
+        'backtest_header': 'Precisión del Pronóstico (Backtesting)',
+        'backtest_caption': 'Validación con origen móvil sobre los ingresos diarios del período cargado: {folds} pronósticos evaluados, mínimo {min_train} días de entrenamiento.',
+        'backtest_no_data': 'No hay suficientes días para evaluar el modelo (se requieren más de {min_train}).',
         'top_products': 'Top 10 Productos por Ingresos',
         'daily_trend': 'Tendencia Diaria de Ingresos',
         'sales_by_group': 'Ingresos por Grupo de Clientes',
@@ -259,6 +307,21 @@ TRANSLATIONS = {
         'download_summary_excel': 'Descargar Resumen (Excel)',
         'download_summary_pdf': 'Descargar Resumen (PDF)',
         'show_raw_data': 'Mostrar Datos Crudos',
+        'raw_source': 'Origen',
+        'raw_source_filtered': 'Vista filtrada',
+        'raw_source_full': 'Dataset completo',
+        'raw_columns': 'Columnas',
+        'raw_sort_by': 'Ordenar por',
+        'raw_descending': 'Descendente',
+        'raw_page_size': 'Filas por página',
+        'raw_page': 'Página',
+        'raw_caption': 'Filas {start}–{end} de {total} (página {page} de {pages}).',
+        'prepare_download': 'Preparar: {label}',
+        'generating_file': 'Generando {file}...',
+        'performance': 'Rendimiento',
+        'performance_caption': 'Memoria medida con tracemalloc en una muestra del {rate:.0%} de las actualizaciones.',
+        'performance_traced_caption': 'Actualización con medición de memoria: los tiempos incluyen el costo de tracemalloc y no se suman a las métricas de tiempo.',
+        'facet_option': '{value} ({lines:,} líneas · ₡{revenue:,.0f})',
         'footer': 'Desarrollado por Wilfredos para ASEAVNA | Fuente de Datos: Órdenes del Punto de Venta (POS) | 2025'
     },
     'en': {
@@ -279,7 +342,7 @@ TRANSLATIONS = {
         'visualizations': 'Visualizations',
         'export': 'Export Summary',
         'raw_data': 'Raw Data',
-        'no_data': 'No data found. Ensure the file "Órdenes del punto de venta (pos.order).xlsx" is available in app/data/.',
+        'no_data': 'No data found. Ensure the POS exports (e.g. "Órdenes del punto de venta (pos.order).xlsx") are available in app/data/.',
         'metrics_summary': 'Key Metrics Summary',
         'orders': 'Total Orders',
         'lines': 'Total Lines',
@@ -289,8 +352,19 @@ TRANSLATIONS = {
         'top_product': 'Top Selling Product',
         'unique_clients': 'Unique Clients',
         'daily_sales': 'Daily Revenue Summary',
-        'duplicates_detected': '⚠️ Duplicate executive lunches detected:',
-        'no_duplicates': '✅ No duplicate executive lunches detected on the same day.',
+        'duplicates_detected': '⚠️ Duplicates of {products} detected {window}:',
+        'no_duplicates': '✅ No duplicates of {products} detected {window}.',
+        'dup_message_day': 'on the same day',
+        'dup_message_shift': 'in the same shift',
+        'dup_message_hours': 'within {hours:g} hours',
+        'dup_message_no_products': 'no products',
+        'dup_products': 'Products to check',
+        'dup_window': 'Duplicate window',
+        'dup_window_day': 'Same day',
+        'dup_window_shift': 'Same shift',
+        'dup_window_hours': 'Within N hours',
+        'dup_hours': 'Window hours',
+        'dup_full_history': 'Audit the full history (ignores filters)',
         'download_excel': 'Download Duplicates (Excel)',
         'download_pdf': 'Download Duplicates (PDF)',
         'unusual_sales': '⚠️ Clients with unusual consumption volume:',
@@ -303,6 +377,21 @@ TRANSLATIONS = {
         'no_predictive_data': 'Not enough historical data for prediction (at least 2 days required).',
         'no_monthly_data': 'Not enough monthly data to calculate product growth (at least two months required).',
         'predictive_error': 'Error in predictive analysis: {error}',
+        'forecast_by': 'Forecast by',
+        'forecast_by_total': 'Total',
+        'forecast_by_product': 'Product',
+        'forecast_by_cost_center': 'Cost Center',
+        'forecast_by_client_group': 'Client Group',
+        'forecast_model': 'Model',
+        'forecast_model_trend': 'Linear trend',
+        'forecast_model_ets': 'Exponential smoothing (ETS)',
+        'forecast_band_trend': '{level:.0%} confidence interval of the mean',
+        'forecast_band_ets': '{level:.0%} prediction interval',
+        'forecast_series': 'Series to plot',
+        'forecast_table': 'Forecasts by Series',
+        'backtest_header': 'Forecast Accuracy (Backtesting)',
+        'backtest_caption': 'Rolling-origin validation over the daily revenue of the loaded period: {folds} forecasts evaluated, at least {min_train} training days.',
+        'backtest_no_data': 'Not enough days to evaluate the model (more than {min_train} required).',
         'top_products': 'Top 10 Products by Revenue',
         'daily_trend': 'Daily Revenue Trend',
         'sales_by_group': 'Revenue by Client Group',
@@ -311,6 +400,21 @@ TRANSLATIONS = {
         'download_summary_excel': 'Download Summary (Excel)',
         'download_summary_pdf': 'Download Summary (PDF)',
         'show_raw_data': 'Show Raw Data',
+        'raw_source': 'Source',
+        'raw_source_filtered': 'Filtered view',
+        'raw_source_full': 'Full dataset',
+        'raw_columns': 'Columns',
+        'raw_sort_by': 'Sort by',
+        'raw_descending': 'Descending',
+        'raw_page_size': 'Rows per page',
+        'raw_page': 'Page',
+        'raw_caption': 'Rows {start}–{end} of {total} (page {page} of {pages}).',
+        'prepare_download': 'Prepare: {label}',
+        'generating_file': 'Generating {file}...',
+        'performance': 'Performance',
+        'performance_caption': 'Memory is measured with tracemalloc on a {rate:.0%} sample of reruns.',
+        'performance_traced_caption': 'Rerun with memory tracing: timings include the tracemalloc overhead and are left out of the timing metrics.',
+        'facet_option': '{value} ({lines:,} lines · ₡{revenue:,.0f})',
         'footer': 'Developed by Wilfredos for ASEAVNA | Data Source: Point of Sale (POS) Orders | 2025'
     }
 }
@@ -374,13 +478,19 @@ st.markdown('</div>', unsafe_allow_html=True)
 st.title(TRANSLATIONS[lang_code]['title'])
 st.markdown(TRANSLATIONS[lang_code]['description'], unsafe_allow_html=True)
 
+# Instrumentación del rerun: cada etapa se mide con un span; la memoria solo en una muestra de reruns
+recorder = SpanRecorder(trace_memory=random.random() < CONFIG['metrics']['memory_sample_rate'])
+if CONFIG['metrics']['enabled']:
+    recorder.start()
+
 # Carga de datos
-df = load_data()
+dataset = load_data()
 
-if df.empty:
+if not dataset['parts']:
     st.warning(TRANSLATIONS[lang_code]['no_data'])
 else:
     # Sidebar: filtros
+    first_date, last_date = dataset_bounds(dataset)
     st.sidebar.header(TRANSLATIONS[lang_code]['filters_header'])
     with st.sidebar.expander(TRANSLATIONS[lang_code]['date_range'], expanded=True):
         date_option = st.selectbox(
@@ -389,91 +499,111 @@ else:
             key="date_option"
         )
         if date_option == "Última Semana":
-            end_date = df['Fecha'].max().date()
+            end_date = last_date.date()
             start_date = end_date - timedelta(days=7)
         elif date_option == "Último Mes":
-            end_date = df['Fecha'].max().date()
+            end_date = last_date.date()
             start_date = end_date - timedelta(days=30)
         elif date_option == "Todo el Período":
-            start_date = df['Fecha'].min().date()
-            end_date = df['Fecha'].max().date()
+            start_date = first_date.date()
+            end_date = last_date.date()
         else:
-            start_date = df['Fecha'].min().date()
-            end_date = df['Fecha'].max().date()
+            start_date = first_date.date()
+            end_date = last_date.date()
 
         date_range = st.date_input(
             TRANSLATIONS[lang_code]['date_range'],
             [start_date, end_date],
-            min_value=df['Fecha'].min().date(),
-            max_value=df['Fecha'].max().date(),
+            min_value=first_date.date(),
+            max_value=last_date.date(),
             key="date_range"
         )
 
+    months = overlapping_months(dataset, date_range if len(date_range) == 2 else None)
+    df = load_partitions(dataset['dataset_version'], months)
+    date_index = get_date_index(df, df.attrs['dataset_version'])
+    st.sidebar.write(f"Particiones mensuales abiertas: {len(months)} de {len(overlapping_months(dataset))}")
+
+    # Filtros en cascada: cada desplegable ofrece solo las opciones con ventas bajo los demás filtros,
+    # con sus líneas e ingresos, calculadas sobre las celdas del cubo en lugar de las filas
+    cube = get_sales_cube(dataset['dataset_version'], months)
+    filter_keys = {
+        'Líneas de la orden': 'product',
+        'Cliente/Nombre principal': 'client_group',
+        'Día de la Semana': 'day',
+        'Cliente/Nombre': 'client',
+        'Centro de Costos Aseavna': 'centro_costos'
+    }
+    with span('facetas'):
+        while True:
+            current = build_selections({col: st.session_state.get(key) for col, key in filter_keys.items()})
+            facets = cube.facets(date_range if len(date_range) == 2 else None, current, list(filter_keys))
+            # Una selección que quedó sin ventas (p. ej. al cambiar las fechas) vuelve a 'Todos', de a una
+            # y empezando por el último filtro de la barra, para conservar las elecciones de arriba
+            stale = [col for col, value in current.items() if value not in facets[col].index]
+            if not stale:
+                break
+            st.session_state[filter_keys[stale[-1]]] = 'Todos'
+
+    def facet_select(label: str, col: str):
+        labels = {value: TRANSLATIONS[lang_code]['facet_option'].format(value=value, lines=lines, revenue=revenue)
+                  for value, lines, revenue in facets[col][['Líneas', 'Total Final']].itertuples()}
+        return st.selectbox(label, ['Todos'] + list(labels), key=filter_keys[col],
+                            format_func=lambda value: labels.get(value, value))
+
     with st.sidebar.expander("Filtros de Categorías"):
-        product_types = ['Todos'] + sorted(df['Líneas de la orden'].dropna().astype(str).unique().tolist())
-        selected_product = st.selectbox(TRANSLATIONS[lang_code]['product_type'], product_types, key="product")
-        
-        client_groups = ['Todos'] + sorted(df['Cliente/Nombre principal'].dropna().astype(str).unique().tolist())
-        selected_client_grp = st.selectbox(TRANSLATIONS[lang_code]['client_group'], client_groups, key="client_group")
-        
-        days_of_week = ['Todos'] + sorted(df['Día de la Semana'].dropna().astype(str).unique().tolist())
-        selected_day = st.selectbox(TRANSLATIONS[lang_code]['day_of_week'], days_of_week, key="day")
-        
-        clients = ['Todos'] + sorted(df['Cliente/Nombre'].dropna().astype(str).unique().tolist())
-        selected_client = st.selectbox(TRANSLATIONS[lang_code]['specific_client'], clients, key="client")
-        
-        centros_costos = ['Todos'] + sorted(df['Centro de Costos Aseavna'].dropna().astype(str).unique().tolist())
-        selected_centro = st.selectbox("Centro de Costos", centros_costos, key="centro_costos")
+        selected_product = facet_select(TRANSLATIONS[lang_code]['product_type'], 'Líneas de la orden')
+        selected_client_grp = facet_select(TRANSLATIONS[lang_code]['client_group'], 'Cliente/Nombre principal')
+        selected_day = facet_select(TRANSLATIONS[lang_code]['day_of_week'], 'Día de la Semana')
+        selected_client = facet_select(TRANSLATIONS[lang_code]['specific_client'], 'Cliente/Nombre')
+        selected_centro = facet_select("Centro de Costos", 'Centro de Costos Aseavna')
 
     if st.sidebar.button(TRANSLATIONS[lang_code]['reset_filters']):
         st.rerun()
 
-    # Aplicar filtros
-    filtered_df = df.copy()
-    total_lines = len(filtered_df)
+    # Aplicar filtros: intersección de listas de posiciones y una sola extracción final
+    filter_index = get_filter_index(df, df.attrs['dataset_version'])
+    total_lines = len(df)
+    row_range = None
     if len(date_range) == 2:
         sd, ed = date_range
-        sd = pd.to_datetime(sd)
-        ed = pd.to_datetime(ed) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
-        filtered_df = filtered_df[
-            (filtered_df['Fecha'] >= sd) &
-            (filtered_df['Fecha'] <= ed)
-        ]
+        row_range = date_index.day_range(sd, ed)
         st.sidebar.write(f"Filas totales antes del filtro: {total_lines}")
-        st.sidebar.write(f"Filas después de filtrar por fechas ({sd.date()} a {ed.date()}): {len(filtered_df)}")
-        st.sidebar.write(f"Órdenes únicas después del filtro: {filtered_df['Número de recibo'].nunique()}")
+        st.sidebar.write(f"Filas después de filtrar por fechas ({sd} a {ed}): {row_range[1] - row_range[0]}")
+        st.sidebar.write(f"Órdenes únicas después del filtro: {df['Número de recibo'].iloc[row_range[0]:row_range[1]].nunique()}")
     else:
         st.warning("Por favor, selecciona un rango de fechas válido.")
 
-    if selected_product != 'Todos':
-        filtered_df = filtered_df[filtered_df['Líneas de la orden'] == selected_product]
-    if selected_client_grp != 'Todos':
-        filtered_df = filtered_df[filtered_df['Cliente/Nombre principal'] == selected_client_grp]
-    if selected_day != 'Todos':
-        filtered_df = filtered_df[filtered_df['Día de la Semana'] == selected_day]
-    if selected_client != 'Todos':
-        selected_client_normalized = selected_client.strip().lower()
-        filtered_df = filtered_df[filtered_df['Cliente/Nombre'] == selected_client_normalized]
-        st.sidebar.write(f"Filas después de filtrar por cliente '{selected_client}': {len(filtered_df)}")
-    if selected_centro != 'Todos':
-        selected_centro_normalized = selected_centro.strip().lower()
-        filtered_df = filtered_df[filtered_df['Centro de Costos Aseavna'] == selected_centro_normalized]
-        st.sidebar.write(f"Filas después de filtrar por centro de costos '{selected_centro}': {len(filtered_df)}")
-
-    product_types = ['Todos'] + sorted(filtered_df['Líneas de la orden'].dropna().astype(str).unique().tolist())
-    client_groups = ['Todos'] + sorted(filtered_df['Cliente/Nombre principal'].dropna().astype(str).unique().tolist())
-    days_of_week = ['Todos'] + sorted(filtered_df['Día de la Semana'].dropna().astype(str).unique().tolist())
-    clients = ['Todos'] + sorted(filtered_df['Cliente/Nombre'].dropna().astype(str).unique().tolist())
-    centros_costos = ['Todos'] + sorted(filtered_df['Centro de Costos Aseavna'].dropna().astype(str).unique().tolist())
+    selections = build_selections({
+        'Líneas de la orden': selected_product,
+        'Cliente/Nombre principal': selected_client_grp,
+        'Día de la Semana': selected_day,
+        'Cliente/Nombre': selected_client,
+        'Centro de Costos Aseavna': selected_centro
+    })
+    recorder.context['filtros'] = {'fechas': [str(day) for day in date_range], **selections}
+    with span('filtros'):
+        filtered_df = select_rows(df, filter_index.select(selections, row_range=row_range))
+    if selections:
+        st.sidebar.write(f"Filas después de aplicar los filtros de categorías: {len(filtered_df)}")
+
+    # Las métricas y agregaciones de las pestañas se obtienen del cubo diario con los mismos filtros
+    with span('cube_select'):
+        cube_cells = cube.select(date_range if len(date_range) == 2 else None, selections)
+    cube_view = cube.view(cube_cells)
+
+    unique_clients = len(category_options(cube_view['Cliente/Nombre']))
 
     # Panel de métricas principales
     st.subheader(TRANSLATIONS[lang_code]['metrics_summary'])
     col1, col2, col3, col4, col5 = st.columns([1, 1, 1, 1, 1])
-    total_orders = filtered_df['Número de recibo'].nunique()
-    total_lines_filtered = len(filtered_df)
-    total_commission = filtered_df['Comision Aseavna'].sum()
-    total_cuentas_cobrar_aseavna = filtered_df['Cuentas por a cobrar aseavna'].sum()
-    total_cuentas_cobrar_avna = filtered_df['Cuentas por a Cobrar Avna'].sum()
+    totals = cube.totals(cube_cells)
+    total_orders = cube.distinct_receipts(cube_cells)
+    total_lines_filtered = int(totals['Líneas'])
+    total_commission = totals['Comision Aseavna']
+    total_cuentas_cobrar_aseavna = totals['Cuentas por a cobrar aseavna']
+    total_cuentas_cobrar_avna = totals['Cuentas por a Cobrar Avna']
+    sales_by_product = cube.rollup(cube_cells, 'Líneas de la orden', ['Total Final'])['Total Final']
 
     with col1:
         st.markdown(f'<div class="metric-box"><span class="title">{TRANSLATIONS[lang_code]["orders"]}</span><span class="value">{total_orders:,}</span></div>', unsafe_allow_html=True)
@@ -498,18 +628,18 @@ else:
     ])
 
     # Tab 1: Métricas Generales
-    with tab1:
+    with tab1, span('tab1_metricas'):
         st.header(TRANSLATIONS[lang_code]['metrics'])
-        most_sold = filtered_df.groupby('Líneas de la orden')['Total Final'].sum().idxmax() if not filtered_df.empty else "N/A"
+        most_sold = sales_by_product.idxmax() if not sales_by_product.empty else "N/A"
         col1, col2 = st.columns(2)
         with col1:
             st.markdown(f'<div class="metric-box"><span class="title">{TRANSLATIONS[lang_code]["top_product"]}</span><span class="value">{most_sold}</span></div>', unsafe_allow_html=True)
         with col2:
-            st.markdown(f'<div class="metric-box"><span class="title">{TRANSLATIONS[lang_code]["unique_clients"]}</span><span class="value">{len(filtered_df["Cliente/Nombre"].unique())}</span></div>', unsafe_allow_html=True)
+            st.markdown(f'<div class="metric-box"><span class="title">{TRANSLATIONS[lang_code]["unique_clients"]}</span><span class="value">{unique_clients}</span></div>', unsafe_allow_html=True)
         
-        daily_summary = filtered_df.groupby(filtered_df['Fecha'].dt.date)['Total Final'].sum().reset_index()
+        daily_summary = cube.rollup(cube_cells, 'Fecha', ['Total Final']).reset_index()
         if not daily_summary.empty:
-            fig_summary = px.line(
+            fig_summary = line_chart(
                 daily_summary, x='Fecha', y='Total Final',
                 labels={'Total Final': 'Ingresos (₡)', 'Fecha': 'Fecha'},
                 title=TRANSLATIONS[lang_code]['daily_sales'],
@@ -547,59 +677,75 @@ else:
             st.warning("No hay datos suficientes para mostrar la tendencia diaria.")
 
     # Tab 2: Verificación de Almuerzos Ejecutivos Duplicados
-    with tab2:
+    with tab2, span('tab2_duplicados'):
         st.header(TRANSLATIONS[lang_code]['duplicates'])
-        lunch_df = filtered_df[filtered_df['Líneas de la orden'] == 'Almuerzo Ejecutivo Aseavna'].copy()
-        lunch_df['Fecha_Dia'] = lunch_df['Fecha'].dt.date
-        dup = lunch_df.groupby(['Cliente/Nombre', 'Fecha_Dia']).filter(lambda x: len(x) > 1)
-        
+        product_options = category_options(df['Líneas de la orden'])
+        windows = ['day', 'shift', 'hours']
+        d1, d2, d3 = st.columns([2, 1, 1])
+        with d1:
+            dup_products = st.multiselect(
+                TRANSLATIONS[lang_code]['dup_products'], product_options,
+                default=[p for p in CONFIG['duplicates']['products'] if p in product_options], key='dup_products'
+            )
+        with d2:
+            dup_window = st.selectbox(
+                TRANSLATIONS[lang_code]['dup_window'], windows,
+                index=windows.index(CONFIG['duplicates']['window']),
+                format_func=lambda w: TRANSLATIONS[lang_code][f'dup_window_{w}'], key='dup_window'
+            )
+        with d3:
+            dup_hours = st.number_input(
+                TRANSLATIONS[lang_code]['dup_hours'], min_value=1, max_value=72,
+                value=CONFIG['duplicates']['hours'], disabled=dup_window != 'hours', key='dup_hours'
+            )
+        dup_hours = dup_hours if dup_window == 'hours' else None
+        full_history = st.checkbox(TRANSLATIONS[lang_code]['dup_full_history'], key='dup_full_history')
+
+        if full_history:
+            audit_source = audit_duplicates(dataset['dataset_version'], tuple(dup_products), dup_window, dup_hours)
+        else:
+            audit_source = filtered_df
+        positions, groups = find_duplicates(audit_source, dup_products, dup_window, dup_hours)
+        dup, summary = duplicate_report(audit_source, positions, groups, dup_window, dup_products)
+        # Los mensajes nombran los productos y la ventana elegidos
+        dup_message = {
+            'products': ', '.join(dup_products) or TRANSLATIONS[lang_code]['dup_message_no_products'],
+            'window': TRANSLATIONS[lang_code][f'dup_message_{dup_window}'].format(hours=dup_hours)
+        }
+
         if not dup.empty:
-            st.markdown(f'<div class="alert-box">{TRANSLATIONS[lang_code]["duplicates_detected"]}</div>', unsafe_allow_html=True)
+            st.markdown(f'<div class="alert-box">{TRANSLATIONS[lang_code]["duplicates_detected"].format(**dup_message)}</div>', unsafe_allow_html=True)
             st.balloons()
-            summary = dup.groupby(['Cliente/Nombre', 'Fecha_Dia']).size().reset_index(name='Cantidad')
             st.dataframe(summary)
             st.subheader("Detalles de Duplicados")
             st.dataframe(dup[['Cliente/Nombre', 'Fecha', 'Número de recibo', 'Líneas de la orden']])
+            dup_key = frame_fingerprint(dup)
             c1, c2 = st.columns(2)
             with c1:
-                buf_xl = generate_excel(dup, "Duplicados", dup.to_string())
-                st.download_button(
+                deferred_download(
                     TRANSLATIONS[lang_code]['download_excel'],
-                    data=buf_xl,
+                    lambda: generate_excel(dup, "Duplicados", dup_key),
                     file_name="almuerzos_duplicados.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                    key="dup_excel",
+                    data_key=dup_key
                 )
             with c2:
-                buf_pdf = generate_pdf(dup, "Reporte de Almuerzos Duplicados", "almuerzos_duplicados.pdf", dup.to_string())
-                st.download_button(
+                deferred_download(
                     TRANSLATIONS[lang_code]['download_pdf'],
-                    data=buf_pdf,
+                    lambda: generate_pdf(dup, "Reporte de Almuerzos Duplicados", "almuerzos_duplicados.pdf", dup_key),
                     file_name="almuerzos_duplicados.pdf",
-                    mime="application/pdf"
+                    mime="application/pdf",
+                    key="dup_pdf",
+                    data_key=dup_key
                 )
         else:
-            st.success(TRANSLATIONS[lang_code]['no_duplicates'])
+            st.success(TRANSLATIONS[lang_code]['no_duplicates'].format(**dup_message))
 
     # Tab 3: Análisis de Consumo por Cliente
-    with tab3:
+    with tab3, span('tab3_clientes'):
         st.header(TRANSLATIONS[lang_code]['client_sales'])
-        client_sales = filtered_df.groupby('Cliente/Nombre').agg({
-            'Total Final': 'sum',
-            'Número de recibo': 'nunique',
-            'Comision Aseavna': 'sum',
-            'Cuentas por a cobrar aseavna': 'sum',
-            'Cuentas por a Cobrar Avna': 'sum',
-            'Líneas de la orden': lambda x: x.mode()[0] if not x.empty else 'N/A'
-        }).reset_index()
-        client_sales.columns = [
-            'Cliente',
-            'Ingresos Totales (₡)',
-            'Número de Órdenes',
-            'Comisión Total (₡)',
-            'Ctas. por Cobrar Aseavna (₡)',
-            'Ctas. por Cobrar Avna (₡)',
-            'Producto Más Comprado'
-        ]
+        client_sales = client_sales_table(cube, cube_cells)
         
         if not client_sales.empty and client_sales['Ingresos Totales (₡)'].sum() > 0:
             threshold = client_sales['Ingresos Totales (₡)'].quantile(0.95)
@@ -627,163 +773,179 @@ else:
         st.dataframe(client_sales_display)
         
         st.subheader(TRANSLATIONS[lang_code]['export_client_sales'])
+        client_key = frame_fingerprint(client_sales)
         c1, c2, c3 = st.columns(3)
         with c1:
-            csv_bytes = client_sales.to_csv(index=False).encode('utf-8')
-            st.download_button(
+            deferred_download(
                 TRANSLATIONS[lang_code]['download_csv'],
-                data=csv_bytes,
+                lambda: client_sales.to_csv(index=False).encode('utf-8'),
                 file_name="ingresos_por_cliente.csv",
-                mime="text/csv"
+                mime="text/csv",
+                key="client_csv",
+                data_key=client_key
             )
         with c2:
-            buf_xl2 = generate_excel(client_sales, "Ingresos por Cliente", client_sales.to_string())
-            st.download_button(
+            deferred_download(
                 TRANSLATIONS[lang_code]['download_excel_client'],
-                data=buf_xl2,
+                lambda: generate_excel(client_sales, "Ingresos por Cliente", client_key),
                 file_name="ingresos_por_cliente.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                key="client_excel",
+                data_key=client_key
             )
         with c3:
-            buf_pdf2 = generate_pdf(client_sales, "Reporte de Ingresos por Cliente - ASEAVNA", "ingresos_por_cliente.pdf", client_sales.to_string())
-            st.download_button(
+            deferred_download(
                 TRANSLATIONS[lang_code]['download_pdf_client'],
-                data=buf_pdf2,
+                lambda: generate_pdf(client_sales, "Reporte de Ingresos por Cliente - ASEAVNA", "ingresos_por_cliente.pdf", client_key),
                 file_name="ingresos_por_cliente.pdf",
-                mime="application/pdf"
+                mime="application/pdf",
+                key="client_pdf",
+                data_key=client_key
             )
 
     # Tab 4: Análisis Predictivo
-    with tab4:
+    with tab4, span('tab4_pronostico'):
         st.header(TRANSLATIONS[lang_code]['predictive'])
         try:
-            # Agrupar por fecha para obtener los ingresos totales diarios (Total Final)
-            daily = filtered_df.groupby(filtered_df['Fecha'].dt.date)['Total Final'].sum().reset_index(name='Total')
-            daily['Days'] = (pd.to_datetime(daily['Fecha']) - pd.to_datetime(daily['Fecha'].min())).dt.days
+            f1, f2 = st.columns(2)
+            with f1:
+                forecast_by = st.selectbox(
+                    TRANSLATIONS[lang_code]['forecast_by'], ['total'] + list(CONFIG['forecast']['dimensions']),
+                    format_func=lambda d: TRANSLATIONS[lang_code][f'forecast_by_{d}'], key='forecast_by'
+                )
+            with f2:
+                forecast_model = st.selectbox(
+                    TRANSLATIONS[lang_code]['forecast_model'], ['trend', 'ets'],
+                    format_func=lambda m: TRANSLATIONS[lang_code][f'forecast_model_{m}'], key='forecast_model'
+                )
+
+            panel = daily_panel(cube, cube_cells, forecast_by)
             
             # Validar que haya suficientes datos para la predicción
-            if len(daily) < 2:
+            if len(panel) < 2 or panel.empty:
                 st.warning(TRANSLATIONS[lang_code]['no_predictive_data'])
             else:
-                # Asegurar que no haya valores nulos en 'Total'
-                daily = daily.dropna(subset=['Total'])
-                if daily.empty:
-                    st.warning("No hay datos válidos para realizar la predicción.")
+                forecasts = forecast_panel(panel, forecast_model, get_model_cache())
+                if forecast_by == 'total':
+                    series = 'Total'
                 else:
-                    # Modelo de regresión lineal para predecir ingresos futuros
-                    X = sm.add_constant(daily['Days'])
-                    model = sm.OLS(daily['Total'], X).fit()
-                    future_days = np.array([daily['Days'].iloc[-1] + i for i in range(1, 8)])
-                    future_X = sm.add_constant(future_days)
-                    preds = model.predict(future_X)
-                    conf_int = model.get_prediction(future_X).conf_int()
-                    
-                    # Crear DataFrame de predicciones con intervalos de confianza
-                    pred_df = pd.DataFrame({
-                        'Fecha': [pd.to_datetime(daily['Fecha']).max() + timedelta(days=i) for i in range(1, 8)],
-                        'Total': preds,
-                        'Lower': np.maximum(conf_int[:, 0], 0),  # Evitar valores negativos
-                        'Upper': np.maximum(conf_int[:, 1], 0),  # Evitar valores negativos
-                        'Tipo': 'Predicción'
-                    })
-                    hist_df = pd.DataFrame({
-                        'Fecha': pd.to_datetime(daily['Fecha']),
-                        'Total': daily['Total'],
-                        'Tipo': 'Histórico'
-                    })
-                    combined = pd.concat([hist_df, pred_df]).reset_index(drop=True)
-                    
-                    # Gráfica de predicción de ingresos
-                    st.subheader(TRANSLATIONS[lang_code]['predictive_subheader'])
-                    fig_pred = px.line(
-                        combined, 
-                        x='Fecha', 
-                        y='Total', 
-                        color='Tipo',
-                        labels={'Total': 'Ingresos Totales (₡)', 'Fecha': 'Fecha'},
-                        title="Tendencia Histórica y Predicción de Ingresos Totales con Intervalos de Confianza",
-                        template="plotly_white",
-                        color_discrete_sequence=["#4CAF50", "#FF5733"]
+                    series = st.selectbox(
+                        TRANSLATIONS[lang_code]['forecast_series'],
+                        panel.sum().sort_values(ascending=False, kind='stable').index.tolist(), key='forecast_series'
                     )
-                    # Añadir intervalos de confianza
-                    fig_pred.add_scatter(
-                        x=pred_df['Fecha'], 
-                        y=pred_df['Upper'], 
-                        mode='lines', 
-                        line=dict(dash='dash', color='gray'), 
-                        name='Límite Superior',
-                        showlegend=True
-                    )
-                    fig_pred.add_scatter(
-                        x=pred_df['Fecha'], 
-                        y=pred_df['Lower'], 
-                        mode='lines', 
-                        line=dict(dash='dash', color='gray'), 
-                        name='Límite Inferior',
-                        showlegend=True
-                    )
-                    # Personalizar el formato del eje Y para mostrar comas
-                    fig_pred.update_layout(
-                        margin=dict(l=20, r=20, t=60, b=20),
-                        xaxis_title_font_size=14,
-                        yaxis_title_font_size=14,
-                        title_x=0.5,
-                        yaxis=dict(
-                            tickformat=",.0f",  # Formato con comas para miles
-                            gridcolor='lightgray'
-                        ),
-                        xaxis=dict(
-                            tickformat="%Y-%m-%d",
-                            gridcolor='lightgray'
-                        ),
-                        legend=dict(
-                            orientation="h",
-                            yanchor="bottom",
-                            y=-0.3,
-                            xanchor="center",
-                            x=0.5
-                        ),
-                        dragmode='zoom',  # Habilitar zoom
-                        modebar=dict(
-                            bgcolor='rgba(0,0,0,0)',
-                            color='rgba(0,0,0,0.5)',
-                            activecolor=CONFIG['colors']['primary']
-                        )
+                # DataFrame de predicciones con los límites del intervalo para la serie elegida
+                pred_df = forecasts[forecasts['Serie'] == series].drop(columns='Serie').reset_index(drop=True)
+                hist_df = pd.DataFrame({
+                    'Fecha': pd.to_datetime(panel.index),
+                    'Total': panel[series].to_numpy(),
+                    'Tipo': 'Histórico'
+                })
+                combined = pd.concat([hist_df, pred_df]).reset_index(drop=True)
+                # La tendencia da el intervalo de la media y ETS el de predicción: bandas distintas, nombres distintos
+                band = TRANSLATIONS[lang_code][f'forecast_band_{forecast_model}'].format(level=1 - CONFIG['forecast']['alpha'])
+                    
+                # Gráfica de predicción de ingresos
+                st.subheader(TRANSLATIONS[lang_code]['predictive_subheader'])
+                fig_pred = line_chart(
+                    combined, 
+                    x='Fecha', 
+                    y='Total', 
+                    color='Tipo',
+                    labels={'Total': 'Ingresos Totales (₡)', 'Fecha': 'Fecha'},
+                    title=f"Tendencia Histórica y Predicción de Ingresos Totales ({band})",
+                    template="plotly_white",
+                    color_discrete_sequence=["#4CAF50", "#FF5733"]
+                )
+                # Añadir los límites del intervalo del modelo
+                fig_pred.add_scatter(
+                    x=pred_df['Fecha'], 
+                    y=pred_df['Upper'], 
+                    mode='lines', 
+                    line=dict(dash='dash', color='gray'), 
+                    name=f'Límite Superior ({band})',
+                    showlegend=True
+                )
+                fig_pred.add_scatter(
+                    x=pred_df['Fecha'], 
+                    y=pred_df['Lower'], 
+                    mode='lines', 
+                    line=dict(dash='dash', color='gray'), 
+                    name=f'Límite Inferior ({band})',
+                    showlegend=True
+                )
+                # Personalizar el formato del eje Y para mostrar comas
+                fig_pred.update_layout(
+                    margin=dict(l=20, r=20, t=60, b=20),
+                    xaxis_title_font_size=14,
+                    yaxis_title_font_size=14,
+                    title_x=0.5,
+                    yaxis=dict(
+                        tickformat=",.0f",  # Formato con comas para miles
+                        gridcolor='lightgray'
+                    ),
+                    xaxis=dict(
+                        tickformat="%Y-%m-%d",
+                        gridcolor='lightgray'
+                    ),
+                    legend=dict(
+                        orientation="h",
+                        yanchor="bottom",
+                        y=-0.3,
+                        xanchor="center",
+                        x=0.5
+                    ),
+                    dragmode='zoom',  # Habilitar zoom
+                    modebar=dict(
+                        bgcolor='rgba(0,0,0,0)',
+                        color='rgba(0,0,0,0.5)',
+                        activecolor=CONFIG['colors']['primary']
                     )
-                    fig_pred.update_xaxes(
-                        rangeslider_visible=True,  # Agregar control deslizante para zoom
-                        rangeselector=dict(
-                            buttons=list([
-                                dict(count=7, label="1w", step="day", stepmode="backward"),
-                                dict(count=1, label="1m", step="month", stepmode="backward"),
-                                dict(step="all", label="Todo")
-                            ])
-                        )
+                )
+                fig_pred.update_xaxes(
+                    rangeslider_visible=True,  # Agregar control deslizante para zoom
+                    rangeselector=dict(
+                        buttons=list([
+                            dict(count=7, label="1w", step="day", stepmode="backward"),
+                            dict(count=1, label="1m", step="month", stepmode="backward"),
+                            dict(step="all", label="Todo")
+                        ])
                     )
-                    st.plotly_chart(fig_pred, use_container_width=True)
-                    add_graph_controls(fig_pred, "predictive_trend")
-                    
-                    # Análisis de crecimiento de productos basado en ingresos (Total Final)
-                    trends = filtered_df.groupby(['Líneas de la orden', filtered_df['Fecha'].dt.to_period('M')])['Total Final'].sum().unstack(fill_value=0)
-                    if trends.shape[1] >= 2:
-                        growth = ((trends.iloc[:, -1] - trends.iloc[:, -2]) / trends.iloc[:, -2].replace(0, np.nan) * 100).replace([np.inf, -np.inf], 0).dropna().sort_values(ascending=False)
-                        top5 = growth.head(5).reset_index()
-                        top5.columns = ['Producto', 'Crecimiento (%)']
-                        st.subheader(TRANSLATIONS[lang_code]['growth_subheader'])
-                        st.dataframe(top5)
+                )
+                st.plotly_chart(fig_pred, use_container_width=True)
+                add_graph_controls(fig_pred, "predictive_trend")
+                if forecast_by != 'total':
+                    st.subheader(TRANSLATIONS[lang_code]['forecast_table'])
+                    st.dataframe(forecasts)
+
+                with st.expander(TRANSLATIONS[lang_code]['backtest_header']):
+                    min_train = CONFIG['backtest']['min_train']
+                    daily_total = daily_panel(cube, cube.select())
+                    if len(daily_total) <= min_train:
+                        st.info(TRANSLATIONS[lang_code]['backtest_no_data'].format(min_train=min_train))
                     else:
-                        st.warning(TRANSLATIONS[lang_code]['no_monthly_data'])
+                        accuracy = backtest_accuracy(df.attrs['dataset_version'], forecast_model,
+                                                     CONFIG['forecast']['horizon'], min_train, daily_total)
+                        st.caption(TRANSLATIONS[lang_code]['backtest_caption'].format(
+                            folds=int(accuracy['Pronósticos'].sum()), min_train=min_train))
+                        st.dataframe(accuracy.style.format({'MAPE (%)': '{:.2f}', 'RMSE': '₡{:,.2f}'}))
+                    
+                # Análisis de crecimiento de productos basado en ingresos (Total Final)
+                trends = cube.rollup(cube_cells, ['Líneas de la orden', 'Mes'], ['Total Final'])['Total Final'].unstack(fill_value=0)
+                if trends.shape[1] >= 2:
+                    growth = ((trends.iloc[:, -1] - trends.iloc[:, -2]) / trends.iloc[:, -2].replace(0, np.nan) * 100).replace([np.inf, -np.inf], 0).dropna().sort_values(ascending=False)
+                    top5 = growth.head(5).reset_index()
+                    top5.columns = ['Producto', 'Crecimiento (%)']
+                    st.subheader(TRANSLATIONS[lang_code]['growth_subheader'])
+                    st.dataframe(top5)
+                else:
+                    st.warning(TRANSLATIONS[lang_code]['no_monthly_data'])
         except Exception as e:
             st.error(TRANSLATIONS[lang_code]['predictive_error'].format(error=str(e)))
 
     # Tab 5: Visualizaciones Detalladas
-    with tab5:
+    with tab5, span('tab5_visualizaciones'):
         st.header(TRANSLATIONS[lang_code]['visualizations'])
-        viz_df = filtered_df.copy()
-        if selected_centro != 'Todos':
-            viz_df = viz_df[viz_df['Centro de Costos Aseavna'] == selected_centro_normalized]
-
-        top10 = viz_df.groupby('Líneas de la orden')['Total Final'].sum().nlargest(10).reset_index()
+        top10 = sales_by_product.nlargest(10).reset_index()
         if not top10.empty and top10['Total Final'].sum() > 0:
             top10['Total Final'] = top10['Total Final'].clip(upper=1e7)
             fig1 = px.bar(
@@ -817,9 +979,9 @@ else:
         else:
             st.warning("No hay datos suficientes o válidos para mostrar los top 10 productos por ingresos.")
 
-        daily_summary = viz_df.groupby(viz_df['Fecha'].dt.date)['Total Final'].sum().reset_index()
+        daily_summary = cube.rollup(cube_cells, 'Fecha', ['Total Final']).reset_index()
         if not daily_summary.empty and daily_summary['Total Final'].sum() > 0:
-            fig2 = px.line(
+            fig2 = line_chart(
                 daily_summary, 
                 x='Fecha', 
                 y='Total Final',
@@ -858,7 +1020,7 @@ else:
         else:
             st.warning("No hay datos suficientes o válidos para mostrar la tendencia diaria de ingresos.")
 
-        grp = viz_df.groupby('Cliente/Nombre principal')['Total Final'].sum().reset_index()
+        grp = cube.rollup(cube_cells, 'Cliente/Nombre principal', ['Total Final']).reset_index()
         if not grp.empty and grp['Total Final'].sum() > 0:
             # Limitar a los 10 grupos con mayores ingresos
             grp = grp.nlargest(10, 'Total Final')
@@ -904,53 +1066,82 @@ else:
             st.warning("No hay datos suficientes o válidos para mostrar los ingresos por grupo de clientes.")
 
     # Tab 6: Resumen de Métricas para Exportar
-    with tab6:
+    with tab6, span('tab6_exportar'):
         st.header(TRANSLATIONS[lang_code]['export'])
-        most_sold = filtered_df.groupby('Líneas de la orden')['Total Final'].sum().idxmax() if not filtered_df.empty else "N/A"
-        least_sold = filtered_df.groupby('Líneas de la orden')['Total Final'].sum().idxmin() if not filtered_df.empty else "N/A"
-        
-        report = {
-            "Número de Órdenes": total_orders,
-            "Líneas Totales": total_lines_filtered,
-            "Comisión Total (₡)": total_commission,
-            "Ctas. por Cobrar Aseavna (₡)": total_cuentas_cobrar_aseavna,
-            "Ctas. por Cobrar Avna (₡)": total_cuentas_cobrar_avna,
-            "Clientes Únicos": len(clients) - 1,
-            "Producto Más Vendido": most_sold,
-            "Producto Menos Vendido": least_sold
-        }
-        report_df = pd.DataFrame([report])
+        report_df = summary_table(cube, cube_cells)
+        report_key = frame_fingerprint(report_df)
         c1, c2, c3 = st.columns(3)
         with c1:
-            st.download_button(
+            deferred_download(
                 TRANSLATIONS[lang_code]['download_summary_csv'],
-                data=report_df.to_csv(index=False).encode('utf-8'),
+                lambda: report_df.to_csv(index=False).encode('utf-8'),
                 file_name="resumen_ventas_aseavna.csv",
-                mime="text/csv"
+                mime="text/csv",
+                key="summary_csv",
+                data_key=report_key
             )
         with c2:
-            buf_xl3 = generate_excel(report_df, "Resumen", report_df.to_string())
-            st.download_button(
+            deferred_download(
                 TRANSLATIONS[lang_code]['download_summary_excel'],
-                data=buf_xl3,
+                lambda: generate_excel(report_df, "Resumen", report_key),
                 file_name="resumen_ventas_aseavna.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                key="summary_excel",
+                data_key=report_key
             )
         with c3:
-            buf_pdf3 = generate_pdf(report_df, "Resumen de Ventas - ASEAVNA", "resumen_ventas_aseavna.pdf", report_df.to_string())
-            st.download_button(
+            deferred_download(
                 TRANSLATIONS[lang_code]['download_summary_pdf'],
-                data=buf_pdf3,
+                lambda: generate_pdf(report_df, "Resumen de Ventas - ASEAVNA", "resumen_ventas_aseavna.pdf", report_key),
                 file_name="resumen_ventas_aseavna.pdf",
-                mime="application/pdf"
+                mime="application/pdf",
+                key="summary_pdf",
+                data_key=report_key
             )
 
     # Tab 7: Datos Crudos
-    with tab7:
+    with tab7, span('tab7_datos_crudos'):
         st.header(TRANSLATIONS[lang_code]['raw_data'])
         if st.checkbox(TRANSLATIONS[lang_code]['show_raw_data']):
-            st.dataframe(df.drop(columns=['Fecha_Valida'], errors='ignore'))
+            sources = ['filtered', 'full']
+            r1, r2 = st.columns(2)
+            with r1:
+                raw_source = st.radio(
+                    TRANSLATIONS[lang_code]['raw_source'], sources, horizontal=True,
+                    format_func=lambda src: TRANSLATIONS[lang_code][f'raw_source_{src}'], key='raw_source'
+                )
+            if raw_source == 'full':
+                raw_df = load_partitions(dataset['dataset_version'], overlapping_months(dataset))
+                raw_key = raw_df.attrs['dataset_version']
+            else:
+                raw_df = filtered_df
+                raw_key = f"{df.attrs['dataset_version']}|{row_range}|{sorted(selections.items())}"
+            all_columns = [col for col in raw_df.columns if col != 'Fecha_Valida']
+            with r2:
+                raw_columns = st.multiselect(TRANSLATIONS[lang_code]['raw_columns'], all_columns, default=all_columns, key='raw_columns')
+
+            r3, r4, r5, r6 = st.columns(4)
+            with r3:
+                sort_column = st.selectbox(TRANSLATIONS[lang_code]['raw_sort_by'], [None] + all_columns,
+                                           format_func=lambda col: '—' if col is None else col, key='raw_sort_by')
+            with r4:
+                descending = st.checkbox(TRANSLATIONS[lang_code]['raw_descending'], key='raw_descending')
+            with r5:
+                page_size = st.selectbox(TRANSLATIONS[lang_code]['raw_page_size'], CONFIG['raw_data']['page_sizes'], key='raw_page_size')
+            total_rows = len(raw_df)
+            n_pages = max(1, -(-total_rows // page_size))
+            with r6:
+                page = st.number_input(TRANSLATIONS[lang_code]['raw_page'], min_value=1, max_value=n_pages, value=1, key='raw_page')
+
+            order = get_sort_order(raw_df, raw_key, sort_column, descending)
+            st.dataframe(raw_data_page(raw_df, order, raw_columns, page, page_size))
+            first_row = min((page - 1) * page_size + 1, total_rows)
+            st.caption(TRANSLATIONS[lang_code]['raw_caption'].format(
+                start=first_row, end=min(page * page_size, total_rows), total=total_rows, page=page, pages=n_pages))
 
 # Pie de página
 st.markdown("---")
-st.markdown(TRANSLATIONS[lang_code]['footer'])
\ No newline at end of file
+st.markdown(TRANSLATIONS[lang_code]['footer'])
+
+if CONFIG['metrics']['enabled']:
+    show_performance(recorder)
@@ -0,0 +1,318 @@
+# Benchmark por etapas del pipeline con exportaciones POS sintéticas de tamaño creciente.
+# Cada etapa reporta el mejor tiempo de varias corridas y el pico de memoria (tracemalloc, en una
+# corrida aparte para no inflar los tiempos) como una línea JSON, para comparar entre versiones.
+#
+#   python sales_benchmark.py --filas 10000 100000 --salida benchmarks.jsonl
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import xlsxwriter
+
+from sales_core import (
+    CONFIG, PngRenderer, FilterIndex, DateIndex, SalesCube, build_pdf, build_excel,
+    sort_positions, raw_data_page, daily_panel, forecast_panel, find_duplicates, duplicate_report,
+    load_excel, validate_data, map_columns, calculate_total, clean_data, add_day_of_week,
+    build_selections, select_rows, client_sales_table, summary_table, dataset_lock, ingest_exports,
+    overlapping_months, read_dataset, read_cube
+)
+
+FIRST_NAMES = ['Maria', 'Jose', 'Ana', 'Luis', 'Carlos', 'Sofia', 'Diego', 'Laura', 'Andres', 'Daniela',
+               'Jorge', 'Valeria', 'Pablo', 'Gabriela', 'Mario', 'Fernanda', 'Ricardo', 'Natalia']
+LAST_NAMES = ['Vargas', 'Mendez', 'Rodriguez', 'Jimenez', 'Mora', 'Rojas', 'Solano', 'Alvarado', 'Castro',
+              'Chaves', 'Araya', 'Quesada', 'Hernandez', 'Salas', 'Brenes', 'Campos', 'Madrigal', 'Zuniga']
+MENU_ITEMS = ['Almuerzo Ejecutivo Aseavna', 'Cafe', 'Empanada', 'Gallo Pinto', 'Jugo Natural', 'Ensalada',
+              'Sandwich', 'Queque', 'Galletas', 'Refresco', 'Cajetas', 'Fruta Picada', 'Bon o bon White']
+
+def synthetic_orders(rows: int, seed: int = 0) -> pd.DataFrame:
+    """Exportación ``pos.order`` sintética con las columnas que exige ``validate_data``.
+
+    Las cardinalidades crecen con el tamaño como en una cafetería real: muchos clientes con
+    actividad desigual, decenas de productos con popularidad tipo Zipf y pocos centros de costos.
+    """
+    rng = np.random.default_rng(seed)
+    n_clients = int(np.clip(rows / 12, 50, 50000))
+    n_groups = max(11, n_clients // 13)
+    n_products = int(np.clip(20 * np.log10(rows), 40, 400))
+    n_centers = int(np.clip(rows ** 0.25, 8, 60))
+    n_days = int(np.clip(rows / 70, 25, 3650))
+
+    clients = np.array([f"{LAST_NAMES[i % 18]} {LAST_NAMES[(i // 18) % 18]} {FIRST_NAMES[(i // 324) % 18]} {i:05d}"
+                        for i in range(n_clients)], dtype=object)
+    client_codes = rng.integers(10**8, 10**12, n_clients).astype(float)
+    client_group = np.array([f"BEN{1 + i % 3}_{i}" for i in rng.integers(0, n_groups, n_clients)], dtype=object)
+    client_center = rng.integers(0, n_centers, n_clients)
+    centers = np.array([f"{55800 + i * 10}-000-00 Centro de costos {i:02d}" for i in range(n_centers)], dtype=object)
+    products = np.array(MENU_ITEMS + [f"Producto {i:03d}" for i in range(n_products - len(MENU_ITEMS))], dtype=object)
+    prices = np.round(rng.uniform(300, 3500, n_products), -1)
+
+    # Recibos de una línea en su mayoría; las líneas de un mismo recibo comparten cliente y hora
+    new_receipt = rng.random(rows) < 0.988
+    new_receipt[0] = True
+    receipt = np.cumsum(new_receipt) - 1
+    n_receipts = receipt[-1] + 1
+    receipts = np.array([f"Orden {r // 10**6:05d}-{(r // 1000) % 1000:03d}-{r % 1000:04d}" for r in range(n_receipts)], dtype=object)
+    activity = rng.gamma(0.8, size=n_clients)
+    receipt_client = rng.choice(n_clients, n_receipts, p=activity / activity.sum())
+    hours = rng.choice([7.5, 10, 12.25, 15.5], n_receipts, p=[0.25, 0.15, 0.45, 0.15]) + rng.normal(0, 0.75, n_receipts)
+    receipt_time = (pd.Timestamp('2025-01-01') + pd.to_timedelta(rng.integers(0, n_days, n_receipts), unit='D')
+                    + pd.to_timedelta(np.clip(hours, 6, 21) * 3600, unit='s').round('s')).to_numpy().copy()
+    # Un 0,5 % de los recibos repite el almuerzo del recibo anterior del mismo cliente ese día
+    repeated = rng.choice(n_receipts - 1, n_receipts // 200, replace=False)
+    receipt_client[repeated + 1] = receipt_client[repeated]
+    receipt_time[repeated + 1] = receipt_time[repeated] + np.timedelta64(90, 'm')
+
+    popularity = 1 / np.arange(1, n_products + 1) ** 1.1
+    product = rng.choice(n_products, rows, p=popularity / popularity.sum())
+    product[np.searchsorted(receipt, np.concatenate([repeated, repeated + 1]))] = 0
+    quantity = rng.choice([1, 2, 3, 4, 5, 6, 7], rows, p=[0.9, 0.05, 0.02, 0.01, 0.01, 0.005, 0.005]).astype(float)
+    client = receipt_client[receipt]
+    total = prices[product] * quantity
+    commission = total * 0.05
+    # Parte de las líneas se cobra a Avna; el resto queda en las cuentas de Aseavna
+    avna = np.where(client_center[client] % 4 == 0, total - commission, np.nan)
+    aseavna = np.where(np.isnan(avna), total - commission, 0.0)
+
+    return pd.DataFrame({
+        'Cliente/Código de barras': client_codes[client],
+        'Cliente/Nombre': clients[client],
+        'Centro de Costos Aseavna': centers[client_center[client]],
+        'Fecha': receipt_time[receipt],
+        'Número de recibo': receipts[receipt],
+        'Cliente/Nombre principal': client_group[client],
+        'Precio total colaborador': total,
+        'Comision Aseavna': commission,
+        'Cuentas por a cobrar aseavna': aseavna,
+        'Cuentas por a Cobrar Avna': avna,
+        'Ventas Totales': aseavna + np.nan_to_num(avna),
+        'Líneas de la orden': products[product],
+        'Líneas de la orden/Cantidad': quantity
+    }).sort_values('Fecha', kind='stable', ignore_index=True)
+
+def write_workbook(frame: pd.DataFrame, path: str):
+    # Libro con el formato de la exportación de Odoo: una sola hoja, encabezado en la primera fila
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True, 'default_date_format': 'yyyy-mm-dd hh:mm:ss'})
+    worksheet = workbook.add_worksheet('Sheet1')
+    worksheet.write_row(0, 0, list(frame.columns))
+    for start in range(0, len(frame), CONFIG['exports']['excel_chunk_rows']):
+        chunk = frame.iloc[start:start + CONFIG['exports']['excel_chunk_rows']]
+        for row, record in enumerate(chunk.astype(object).where(chunk.notna(), None).values.tolist(), start=start + 1):
+            worksheet.write_row(row, 0, record)
+    workbook.close()
+
+def synthetic_workbook(rows: int, seed: int, directory: str):
+    # Los libros se reutilizan entre corridas; no caben en una hoja por encima del límite de Excel
+    if rows > CONFIG['exports']['excel_max_rows'] - 1:
+        return None
+    path = os.path.join(directory, f"synthetic_pos_{rows}_{seed}.xlsx")
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        write_workbook(synthetic_orders(rows, seed), path + '.tmp.xlsx')
+        os.replace(path + '.tmp.xlsx', path)
+    return path
+
+def measure(stage: str, rows: int, func, args=lambda: (), repeat: int = 3) -> tuple:
+    # args() arma entradas nuevas en cada corrida (las etapas de limpieza modifican su DataFrame)
+    best = float('inf')
+    for _ in range(repeat):
+        inputs = args()
+        start = time.perf_counter()
+        result = func(*inputs)
+        best = min(best, time.perf_counter() - start)
+    inputs = args()
+    tracemalloc.start()
+    try:
+        func(*inputs)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'stage': stage, 'rows': rows, 'seconds': round(best, 6), 'peak_mb': round(peak / 2**20, 3),
+            'repeat': repeat}, result
+
+def skipped(stage: str, rows: int, reason: str) -> dict:
+    return {'stage': stage, 'rows': rows, 'seconds': None, 'peak_mb': None, 'skipped': reason}
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'stage': 'entorno', 'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'commit': commit, 'python': platform.python_version(), 'pandas': pd.__version__,
+            'numpy': np.__version__, 'cpus': os.cpu_count(), 'platform': platform.platform()}
+
+def dataset_stages(df: pd.DataFrame, rows: int, path: str, repeat: int):
+    # Ingesta de la exportación ya limpia a un dataset vacío (particiones mensuales, celdas del cubo y
+    # vistas Arrow) y lectura de todos sus meses, filas y cubo, en un directorio de caché temporal
+    cache_dir = CONFIG['data']['cache_dir']
+    work_dir = tempfile.mkdtemp(prefix='sales_benchmark_dataset_')
+    if path is None:
+        # Sin libro de Excel la ingesta solo necesita un archivo del que tomar la huella
+        path = os.path.join(work_dir, 'exportacion.xlsx')
+        with open(path, 'wb') as f:
+            f.write(b'0')
+    CONFIG['data']['cache_dir'] = os.path.join(work_dir, 'cache')
+
+    def fresh_cache():
+        # Cada corrida parte de un dataset vacío; el de la corrida anterior se borra fuera del tiempo medido
+        shutil.rmtree(CONFIG['data']['cache_dir'], ignore_errors=True)
+        return ()
+
+    def ingest():
+        with dataset_lock():
+            return ingest_exports([path], lambda _: df)[0]
+    try:
+        record, manifest = measure('ingest_exports', rows, ingest, fresh_cache, repeat)
+        yield record
+        months = tuple(overlapping_months(manifest))
+        record, _ = measure('read_dataset', rows, read_dataset, lambda: (manifest, months), repeat)
+        yield {**record, 'months': len(months)}
+        record, _ = measure('read_cube', rows, read_cube, lambda: (manifest, months), repeat)
+        yield {**record, 'months': len(months)}
+    finally:
+        CONFIG['data']['cache_dir'] = cache_dir
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def run_stages(rows: int, seed: int, directory: str, repeat: int, renderer: PngRenderer):
+    # Carga y limpieza, en el mismo orden que load_export
+    path = synthetic_workbook(rows, seed, directory)
+    if path is None:
+        yield skipped('load_excel', rows, f"más de {CONFIG['exports']['excel_max_rows'] - 1} filas no caben en una hoja de Excel")
+        raw = synthetic_orders(rows, seed)
+    else:
+        record, raw = measure('load_excel', rows, load_excel, lambda: (path,), repeat)
+        yield record
+    if not validate_data(raw):
+        return
+    record, df = measure('map_columns', rows, map_columns, lambda: (raw.copy(),), repeat)
+    yield record
+    record, df = measure('calculate_total', rows, calculate_total, lambda: (df.copy(),), repeat)
+    yield record
+    record, df = measure('clean_data', rows, clean_data, lambda: (df.copy(),), repeat)
+    yield record
+    record, df = measure('add_day_of_week', rows, add_day_of_week, lambda: (df.copy(),), repeat)
+    yield record
+    df = df.reset_index(drop=True)
+    yield from dataset_stages(df, rows, path, repeat)
+
+    # Estructuras que el tablero construye una vez por versión del dataset
+    record, (filter_index, date_index) = measure(
+        'indices', rows, lambda: (FilterIndex(df, CONFIG['filter_dimensions']), DateIndex(df['Fecha'])), repeat=repeat)
+    yield record
+    record, cube = measure('cubo', rows, SalesCube, lambda: (df,), repeat)
+    yield record
+
+    # Filtros del sidebar: opciones en cascada de cada selector sobre las celdas del cubo, como el
+    # tablero, con un rango de fechas y un grupo de clientes
+    date_range = (df['Fecha'].iloc[0].date(), df['Fecha'].iloc[-1].date())
+    group = df['Cliente/Nombre principal'].value_counts().index[0]
+
+    def sidebar_filters():
+        selections = build_selections({'Cliente/Nombre principal': group})
+        cube.facets(date_range, selections, CONFIG['filter_dimensions'])
+        filtered = select_rows(df, filter_index.select(selections, row_range=date_index.day_range(*date_range)))
+        return selections, filtered
+    record, (selections, filtered_df) = measure('filtros_sidebar', rows, sidebar_filters, repeat=repeat)
+    yield record
+    cells = cube.select(date_range, selections)
+
+    def metrics():
+        cube.totals(cells)
+        cube.distinct_receipts(cells)
+        cube.rollup(cells, 'Líneas de la orden', ['Total Final'])
+        return cube.rollup(cells, 'Fecha', ['Total Final']).reset_index()
+
+    def duplicates():
+        products = CONFIG['duplicates']['products']
+        positions, groups = find_duplicates(filtered_df, products, CONFIG['duplicates']['window'])
+        return duplicate_report(filtered_df, positions, groups, CONFIG['duplicates']['window'], products)[0]
+
+    def forecast():
+        forecasts = forecast_panel(daily_panel(cube, cells), 'trend')
+        cube.rollup(cells, ['Líneas de la orden', 'Mes'], ['Total Final'])['Total Final'].unstack(fill_value=0)
+        return forecasts
+
+    def visualizations():
+        cube.rollup(cells, 'Líneas de la orden', ['Total Final'])['Total Final'].nlargest(10)
+        cube.rollup(cells, 'Fecha', ['Total Final'])
+        cube.rollup(cells, 'Cliente/Nombre principal', ['Total Final']).nlargest(10, 'Total Final')
+
+    def raw_data():
+        order = sort_positions(filtered_df['Cliente/Nombre'])
+        return raw_data_page(filtered_df, order, list(filtered_df.columns), 1, CONFIG['raw_data']['page_sizes'][0])
+
+    record, daily = measure('tab1_metricas', rows, metrics, repeat=repeat)
+    yield record
+    record, dup = measure('tab2_duplicados', rows, duplicates, repeat=repeat)
+    yield record
+    record, client_sales = measure('tab3_clientes', rows, client_sales_table, lambda: (cube, cells), repeat)
+    yield record
+    record, _ = measure('tab4_pronostico', rows, forecast, repeat=repeat)
+    yield record
+    record, _ = measure('tab5_visualizaciones', rows, visualizations, repeat=repeat)
+    yield record
+    record, _ = measure('tab6_resumen', rows, summary_table, lambda: (cube, cells), repeat)
+    yield record
+    record, _ = measure('tab7_datos_crudos', rows, raw_data, repeat=repeat)
+    yield record
+
+    # Exportaciones sin la caché de artefactos del tablero. Las tablas del grupo filtrado son las del
+    # tablero pero quedan chicas; la de todos los clientes y los datos crudos crecen con --filas y llegan
+    # a la escritura por bloques de Excel (excel_stream_rows) y a los PDF de muchas páginas
+    all_clients = client_sales_table(cube, cube.select(date_range))
+    raw_rows = df.iloc[:CONFIG['exports']['excel_max_rows'] - 1]
+    exports = (('clientes', client_sales, True), ('duplicados', dup, True),
+               ('clientes_todos', all_clients, True), ('datos_crudos', raw_rows, False))
+    for name, data, pdf in exports:
+        record, _ = measure(f'generate_excel_{name}', rows, build_excel, lambda: (data, 'Reporte'), repeat)
+        yield {**record, 'table_rows': len(data)}
+        if pdf:
+            record, _ = measure(f'generate_pdf_{name}', rows, build_pdf, lambda: (data, 'Reporte'), repeat)
+            yield {**record, 'table_rows': len(data)}
+
+    if not renderer.warm:
+        yield skipped('png_export', rows, "Kaleido no pudo iniciar Chrome")
+    else:
+        fig_json = px.line(daily, x='Fecha', y='Total Final').to_json()
+        record, _ = measure('png_export', rows, renderer.render, lambda: (fig_json,), repeat)
+        yield record
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark por etapas con exportaciones POS sintéticas.")
+    parser.add_argument('--filas', nargs='+', type=int, default=[10_000, 100_000],
+                        help="Tamaños a medir, p. ej. 10000 100000 1000000 10000000")
+    parser.add_argument('--repeticiones', type=int, default=3, help="Corridas por etapa; se reporta la más rápida")
+    parser.add_argument('--semilla', type=int, default=0, help="Semilla del generador sintético")
+    parser.add_argument('--directorio', default=os.path.join(tempfile.gettempdir(), 'sales_benchmark'),
+                        help="Directorio donde se guardan los libros sintéticos")
+    parser.add_argument('--salida', help="Archivo JSONL donde se agregan los resultados (por defecto, stdout)")
+    args = parser.parse_args(argv)
+
+    logging.getLogger('sales_core').setLevel(logging.WARNING)
+    out = open(args.salida, 'a', encoding='utf-8') if args.salida else sys.stdout
+    try:
+        renderer = PngRenderer(1)
+        print(json.dumps(environment(), ensure_ascii=False), file=out, flush=True)
+        for rows in args.filas:
+            for record in run_stages(rows, args.semilla, args.directorio, args.repeticiones, renderer):
+                print(json.dumps(record, ensure_ascii=False), file=out, flush=True)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
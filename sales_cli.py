@@ -0,0 +1,134 @@
+# Trabajos por lotes sin interfaz: incorpora las exportaciones POS nuevas y genera los reportes del
+# tablero directamente a archivos, para correr desde cron o el programador de tareas.
+#
+#   python sales_cli.py ingesta
+#   python sales_cli.py reporte --desde 2025-05-01 --hasta 2025-05-15 --formato xlsx pdf --salida reportes
+import argparse
+import logging
+import os
+import sys
+
+import pandas as pd
+
+from sales_core import (
+    CONFIG, FilterIndex, DateIndex, build_pdf, build_excel, daily_panel, forecast_panel,
+    find_duplicates, duplicate_report, dataset_bounds, overlapping_months, read_dataset, read_cube, audit_history,
+    load_dataset, build_selections, select_rows, client_sales_table, summary_table
+)
+
+# Reportes disponibles: nombre de archivo, hoja de Excel y título del PDF, los mismos del tablero
+REPORTS = {
+    'resumen': ('resumen_ventas_aseavna', 'Resumen', 'Resumen de Ventas - ASEAVNA'),
+    'clientes': ('ingresos_por_cliente', 'Ingresos por Cliente', 'Reporte de Ingresos por Cliente - ASEAVNA'),
+    'duplicados': ('almuerzos_duplicados', 'Duplicados', 'Reporte de Almuerzos Duplicados'),
+    'pronostico': ('pronostico_ingresos', 'Pronóstico', 'Pronóstico de Ingresos - ASEAVNA')
+}
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Análisis de ventas ASEAVNA por lotes, sin Streamlit.")
+    parser.add_argument('--datos', default=CONFIG['data']['dir'], help="Directorio con las exportaciones POS (.xlsx)")
+    parser.add_argument('--cache', help="Directorio del dataset particionado y sus cachés (por defecto, <datos>/.cache); "
+                                       "cada directorio de datos necesita el suyo, porque la ingesta descarta lo que no esté en --datos")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Mostrar los mensajes de la carga de datos")
+    commands = parser.add_subparsers(dest='comando', required=True)
+
+    commands.add_parser('ingesta', help="Incorporar las exportaciones nuevas al dataset particionado")
+
+    report = commands.add_parser('reporte', help="Generar reportes a archivos")
+    report.add_argument('--desde', type=pd.Timestamp, help="Primer día del período (por defecto, el primero con datos)")
+    report.add_argument('--hasta', type=pd.Timestamp, help="Último día del período (por defecto, el último con datos)")
+    report.add_argument('--producto', help="Línea de la orden")
+    report.add_argument('--grupo', help="Grupo de clientes (Cliente/Nombre principal)")
+    report.add_argument('--dia', help="Día de la semana, p. ej. Lunes")
+    report.add_argument('--cliente', help="Cliente específico")
+    report.add_argument('--centro', help="Centro de costos")
+    report.add_argument('--reportes', nargs='+', choices=list(REPORTS), default=list(REPORTS),
+                        help="Reportes a generar (por defecto, todos)")
+    report.add_argument('--formato', nargs='+', choices=['csv', 'xlsx', 'pdf'], default=['xlsx'],
+                        help="Formatos de salida (por defecto, xlsx)")
+    report.add_argument('--salida', default='reportes', help="Directorio de salida")
+    report.add_argument('--productos-duplicados', nargs='+', default=CONFIG['duplicates']['products'],
+                        help="Productos que se revisan en el reporte de duplicados")
+    report.add_argument('--ventana', choices=['day', 'shift', 'hours'], default=CONFIG['duplicates']['window'],
+                        help="Ventana de duplicados: día, turno u horas")
+    report.add_argument('--horas', type=float, default=CONFIG['duplicates']['hours'],
+                        help="Horas de la ventana cuando --ventana es hours")
+    report.add_argument('--historial', action='store_true',
+                        help="Auditar duplicados en todo el historial en lugar del período filtrado")
+    report.add_argument('--pronostico-por', choices=['total'] + list(CONFIG['forecast']['dimensions']), default='total',
+                        help="Serie a pronosticar: total o una serie por dimensión")
+    report.add_argument('--modelo', choices=['trend', 'ets'], default='trend', help="Modelo de pronóstico")
+    return parser.parse_args(argv)
+
+def build_reports(args, manifest: dict) -> dict:
+    first_date, last_date = dataset_bounds(manifest)
+    date_range = ((args.desde or first_date).date(), (args.hasta or last_date).date())
+    months = overlapping_months(manifest, date_range)
+    df = read_dataset(manifest, months)
+    selections = build_selections({
+        'Líneas de la orden': args.producto,
+        'Cliente/Nombre principal': args.grupo,
+        'Día de la Semana': args.dia,
+        'Cliente/Nombre': args.cliente,
+        'Centro de Costos Aseavna': args.centro
+    })
+    cube = read_cube(manifest, months)
+    cells = cube.select(date_range, selections)
+
+    tables = {}
+    if 'resumen' in args.reportes:
+        tables['resumen'] = summary_table(cube, cells)
+    if 'clientes' in args.reportes:
+        tables['clientes'] = client_sales_table(cube, cells)
+    if 'duplicados' in args.reportes:
+        hours = args.horas if args.ventana == 'hours' else None
+        if args.historial:
+            frame = audit_history(manifest, args.productos_duplicados, args.ventana, hours)
+        else:
+            rows = FilterIndex(df, CONFIG['filter_dimensions']).select(selections, DateIndex(df['Fecha']).day_range(*date_range))
+            frame = select_rows(df, rows)
+        positions, groups = find_duplicates(frame, args.productos_duplicados, args.ventana, hours)
+        tables['duplicados'], _ = duplicate_report(frame, positions, groups, args.ventana, args.productos_duplicados)
+    if 'pronostico' in args.reportes:
+        panel = daily_panel(cube, cells, args.pronostico_por)
+        if len(panel) < 2:
+            logging.getLogger('sales_core').warning("No hay suficientes días con ventas para el pronóstico.")
+        else:
+            tables['pronostico'] = forecast_panel(panel, args.modelo)
+    return tables
+
+def write_reports(tables: dict, formats: list, directory: str) -> list:
+    os.makedirs(directory, exist_ok=True)
+    written = []
+    for name, data in tables.items():
+        stem, sheet_name, title = REPORTS[name]
+        for fmt in formats:
+            path = os.path.join(directory, f"{stem}.{fmt}")
+            if fmt == 'csv':
+                data.to_csv(path, index=False)
+            else:
+                content = build_excel(data, sheet_name) if fmt == 'xlsx' else build_pdf(data, title)
+                with open(path, 'wb') as f:
+                    f.write(content)
+            written.append(path)
+    return written
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format='%(levelname)s: %(message)s')
+    # El dataset refleja solo las exportaciones de --datos: con otra carpeta, el del tablero no se toca
+    CONFIG['data']['cache_dir'] = args.cache or os.path.join(args.datos, '.cache')
+    manifest = load_dataset(args.datos)
+    if not manifest['parts']:
+        print(f"No hay datos disponibles en {args.datos}.", file=sys.stderr)
+        return 1
+    if args.comando == 'ingesta':
+        print(f"Dataset {manifest['dataset_version']}: {sum(part['rows'] for part in manifest['parts'])} filas "
+              f"en {len(manifest['parts'])} particiones")
+        return 0
+    for path in write_reports(build_reports(args, manifest), args.formato, args.salida):
+        print(path)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,1415 @@
+# Núcleo de análisis de ventas sin Streamlit: ingesta de exportaciones POS, filtros, agregación,
+# pronósticos y exportaciones. Lo usan el tablero (sales_analysis_app.py) y los trabajos por lotes
+# (sales_cli.py); los mensajes para el usuario se emiten por el logger 'sales_core'.
+import io
+import os
+import sys
+import time
+import json
+import glob
+import shutil
+import hashlib
+import logging
+import threading
+import tracemalloc
+import tempfile
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+try:
+    import resource
+except ImportError:  # Windows: sin getrusage no se informa la memoria de la carga
+    resource = None
+try:
+    import fcntl
+except ImportError:  # Windows: el dataset solo se protege entre hilos del mismo proceso
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import openpyxl
+import xlsxwriter
+from reportlab.lib.pagesizes import letter
+from reportlab.lib import colors
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Image, Flowable
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.lib.styles import getSampleStyleSheet
+
+import forecasting
+import backtesting
+
+logger = logging.getLogger('sales_core')
+
+# Configuración centralizada
+CONFIG = {
+    'columns': {
+        'Cliente/Código de barras': 'Cliente/Código de barras',
+        'Cliente/Nombre': 'Cliente/Nombre',
+        'Centro de Costos Aseavna': 'Centro de Costos Aseavna',
+        'Fecha': 'Fecha',
+        'Número de recibo': 'Número de recibo',
+        'Cliente/Nombre principal': 'Cliente/Nombre principal',
+        'Precio total colaborador': 'Precio total colaborador',
+        'Comision Aseavna': 'Comision Aseavna',
+        'Cuentas por a cobrar aseavna': 'Cuentas por a cobrar aseavna',
+        'Cuentas por a Cobrar Avna': 'Cuentas por a Cobrar Avna',
+        'Líneas de la orden': 'Líneas de la orden',
+        'Líneas de la orden/Cantidad': 'Líneas de la orden/Cantidad'
+    },
+    'required_columns': [
+        'Cliente/Código de barras', 'Cliente/Nombre', 'Centro de Costos Aseavna', 'Fecha', 'Número de recibo',
+        'Cliente/Nombre principal', 'Precio total colaborador', 'Comision Aseavna', 'Cuentas por a cobrar aseavna',
+        'Cuentas por a Cobrar Avna', 'Ventas Totales', 'Líneas de la orden', 'Líneas de la orden/Cantidad'
+    ],
+    'dtypes': {
+        'numeric': ['Precio total colaborador', 'Comision Aseavna', 'Cuentas por a cobrar aseavna',
+                    'Cuentas por a Cobrar Avna', 'Ventas Totales', 'Líneas de la orden/Cantidad'],
+        'categorical': ['Cliente/Nombre', 'Centro de Costos Aseavna', 'Cliente/Nombre principal', 'Líneas de la orden'],
+        'datetime': ['Fecha']
+    },
+    'cube': {
+        'dimensions': ['Líneas de la orden', 'Cliente/Nombre principal', 'Cliente/Nombre', 'Centro de Costos Aseavna'],
+        'measures': ['Total Final', 'Comision Aseavna', 'Cuentas por a cobrar aseavna', 'Cuentas por a Cobrar Avna']
+    },
+    'filter_dimensions': ['Líneas de la orden', 'Cliente/Nombre principal', 'Día de la Semana', 'Cliente/Nombre', 'Centro de Costos Aseavna'],
+    'forecast': {
+        'horizon': 7,
+        'degree': 1,
+        'alpha': 0.05,
+        'workers': max(1, (os.cpu_count() or 1) - 1),
+        'cache_entries': 64,
+        'dimensions': {
+            'product': 'Líneas de la orden',
+            'cost_center': 'Centro de Costos Aseavna',
+            'client_group': 'Cliente/Nombre principal'
+        }
+    },
+    'backtest': {
+        'min_train': 14,
+        'step': 1
+    },
+    'duplicates': {
+        'products': ['Almuerzo Ejecutivo Aseavna'],
+        'window': 'day',
+        'hours': 4,
+        'shifts': [[0, 'Mañana'], [10, 'Mediodía'], [15, 'Tarde/Noche']]
+    },
+    'data': {
+        'dir': 'app/data',
+        'cache_dir': 'app/data/.cache',
+        'line_identity': ['Número de recibo', 'Fecha', 'Cliente/Nombre', 'Líneas de la orden',
+                          'Líneas de la orden/Cantidad', 'Precio total colaborador'],
+        'cache_version': 4
+    },
+    'raw_data': {
+        'page_sizes': [100, 250, 500, 1000]
+    },
+    'metrics': {
+        'enabled': True,
+        'memory_sample_rate': 0.1,
+        'jsonl_path': 'app/data/.cache/metrics/spans.jsonl',
+        'jsonl_max_bytes': 16 * 1024 * 1024,
+        'prometheus_path': 'app/data/.cache/metrics/sales_app.prom'
+    },
+    'charts': {
+        'pixel_width': 1200,
+        'points_per_pixel': 1,
+        'webgl_threshold': 1000
+    },
+    'exports': {
+        'cache_max_bytes': 64 * 1024 * 1024,
+        'spool_max_bytes': 8 * 1024 * 1024,
+        'excel_stream_rows': 50000,
+        'excel_sample_rows': 1000,
+        'excel_chunk_rows': 10000,
+        'excel_max_rows': 1048576,
+        'png_workers': 2,
+        'png_scale': 2
+    },
+    'styles': {
+        'metric_box': 'border: 1px solid #d3d3d3; padding: 10px; border-radius: 5px; background-color: white; margin: 5px auto; text-align: center; width: 90%; display: flex; flex-direction: column; justify-content: center; align-items: center;',
+        'alert_box': 'background-color: #ff4d4d; padding: 10px; border-radius: 5px; margin: 10px auto; color: white; text-align: center; width: 90%;'
+    },
+    'colors': {
+        'primary': '#4CAF50',
+        'secondary': '#2c3e50',
+        'warning': '#ffeb3b'
+    }
+}
+
+# Caché de reportes generados, direccionada por contenido
+def frame_fingerprint(data: pd.DataFrame) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((data.shape, list(data.columns), [str(t) for t in data.dtypes])).encode('utf-8'))
+    if not data.empty:
+        digest.update(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+class ArtifactCache:
+    """LRU de bytes generados, acotada por tamaño total."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return data
+
+    def put(self, key, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= len(self._entries.pop(key))
+            while self._entries and self.total_bytes + len(data) > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.total_bytes -= len(evicted)
+            self._entries[key] = data
+            self.total_bytes += len(data)
+
+# Instrumentación por etapas: spans con nombre medidos con perf_counter y, en una muestra de las
+# corridas, con tracemalloc. Sin un SpanRecorder activo, span() no mide nada.
+_active_recorder = contextvars.ContextVar('sales_core_recorder', default=None)
+# tracemalloc es global al proceso: solo un recorder a la vez lo usa, los demás miden solo tiempos
+_TRACE_LOCK = threading.Lock()
+
+class SpanRecorder:
+    """Spans de una corrida: un rerun del tablero o un trabajo por lotes."""
+
+    def __init__(self, trace_memory: bool = False, **context):
+        self.trace_memory = trace_memory
+        self.context = context
+        self.spans = []
+        self._stack = []
+        self._origin = None
+        self._tracing = False
+
+    def start(self) -> 'SpanRecorder':
+        previous = _active_recorder.get()
+        if previous is not None:
+            previous.stop()
+        self._origin = time.perf_counter()
+        _active_recorder.set(self)
+        return self
+
+    def stop(self):
+        if _active_recorder.get() is self:
+            _active_recorder.set(None)
+
+    @contextmanager
+    def measure(self, name: str, labels: dict):
+        # tracemalloc se enciende solo dentro de los spans de primer nivel y se apaga al salir de ellos,
+        # también por excepción o st.stop(); una corrida cortada no lo deja activo para el proceso
+        owns_tracing = False
+        if self.trace_memory and not self._stack and _TRACE_LOCK.acquire(blocking=False):
+            if tracemalloc.is_tracing():
+                # Lo encendió otro código (p. ej. el benchmark): sus picos no se tocan
+                _TRACE_LOCK.release()
+            else:
+                tracemalloc.start()
+                owns_tracing = self._tracing = True
+        tracing = self._tracing
+        entry = {'span': name, **labels, 'depth': len(self._stack)}
+        if tracing:
+            # Con tracemalloc activo el tiempo sale inflado: el span se marca y no entra en los agregados
+            entry['traced'] = True
+            # El pico se reinicia por span; el span contenedor conserva el máximo de sus hijos
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                self._stack[-1]['_peak'] = max(self._stack[-1]['_peak'], peak)
+            tracemalloc.reset_peak()
+            entry['_base'], entry['_peak'] = current, current
+        self._stack.append(entry)
+        start = time.perf_counter()
+        try:
+            yield entry
+        finally:
+            entry['start'] = start - self._origin
+            entry['seconds'] = time.perf_counter() - start
+            self._stack.pop()
+            if tracing:
+                peak = max(entry.pop('_peak'), tracemalloc.get_traced_memory()[1])
+                entry['peak_mb'] = (peak - entry.pop('_base')) / 2**20
+                if self._stack:
+                    self._stack[-1]['_peak'] = max(self._stack[-1]['_peak'], peak)
+            if owns_tracing:
+                tracemalloc.stop()
+                self._tracing = False
+                _TRACE_LOCK.release()
+            self.spans.append(entry)
+
+    def table(self) -> pd.DataFrame:
+        spans = sorted(self.spans, key=lambda entry: entry['start'])
+        return pd.DataFrame({
+            'Etapa': ['· ' * entry['depth'] + entry['span'] for entry in spans],
+            'ms': [entry['seconds'] * 1000 for entry in spans],
+            'MB': [entry.get('peak_mb') for entry in spans]
+        })
+
+@contextmanager
+def span(name: str, **labels):
+    recorder = _active_recorder.get()
+    if recorder is None:
+        yield None
+        return
+    with recorder.measure(name, labels) as entry:
+        yield entry
+
+def prometheus_labels(labels: dict) -> str:
+    escape = lambda value: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ','.join(f'{key}="{escape(value)}"' for key, value in labels)
+
+class MetricsSink:
+    """Publica los spans en un JSONL local y en un archivo de texto de Prometheus (textfile collector)."""
+
+    def __init__(self, jsonl_path: str, prometheus_path: str, jsonl_max_bytes: int):
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self.jsonl_max_bytes = jsonl_max_bytes
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def publish(self, recorder: SpanRecorder):
+        if not recorder.spans:
+            return
+        timestamp = datetime.now().isoformat(timespec='milliseconds')
+        with self._lock:
+            os.makedirs(os.path.dirname(self.jsonl_path), exist_ok=True)
+            if os.path.exists(self.jsonl_path) and os.path.getsize(self.jsonl_path) > self.jsonl_max_bytes:
+                os.replace(self.jsonl_path, self.jsonl_path + '.1')
+            with open(self.jsonl_path, 'a', encoding='utf-8') as f:
+                for entry in recorder.spans:
+                    f.write(json.dumps({'timestamp': timestamp, **recorder.context, **entry}, ensure_ascii=False, default=str) + '\n')
+            for entry in recorder.spans:
+                labels = (('span', entry['span']),) + tuple(
+                    (key, value) for key, value in entry.items()
+                    if key not in ('span', 'depth', 'start', 'seconds', 'peak_mb', 'traced'))
+                total = self._totals.setdefault(labels, {'count': 0, 'sum': 0.0, 'last': 0.0, 'peak_mb': None})
+                if entry.get('traced'):
+                    # Los spans con tracemalloc solo aportan el pico de memoria
+                    if entry.get('peak_mb') is not None:
+                        total['peak_mb'] = entry['peak_mb']
+                    continue
+                total['count'] += 1
+                total['sum'] += entry['seconds']
+                total['last'] = entry['seconds']
+                if entry.get('peak_mb') is not None:
+                    total['peak_mb'] = entry['peak_mb']
+            self._write_prometheus()
+
+    def _write_prometheus(self):
+        lines = ['# HELP sales_span_seconds Tiempo por etapa del tablero de ventas.', '# TYPE sales_span_seconds summary']
+        timed = [(labels, total) for labels, total in sorted(self._totals.items()) if total['count']]
+        for labels, total in timed:
+            lines.append(f"sales_span_seconds_sum{{{prometheus_labels(labels)}}} {total['sum']:.6f}")
+            lines.append(f"sales_span_seconds_count{{{prometheus_labels(labels)}}} {total['count']}")
+        lines += ['# HELP sales_span_last_seconds Duración de la última ejecución de cada etapa.',
+                  '# TYPE sales_span_last_seconds gauge']
+        lines += [f"sales_span_last_seconds{{{prometheus_labels(labels)}}} {total['last']:.6f}"
+                  for labels, total in timed]
+        lines += ['# HELP sales_span_peak_bytes Pico de memoria de la última muestra con tracemalloc.',
+                  '# TYPE sales_span_peak_bytes gauge']
+        lines += [f"sales_span_peak_bytes{{{prometheus_labels(labels)}}} {int(total['peak_mb'] * 2**20)}"
+                  for labels, total in sorted(self._totals.items()) if total['peak_mb'] is not None]
+        os.makedirs(os.path.dirname(self.prometheus_path), exist_ok=True)
+        with open(self.prometheus_path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(self.prometheus_path + '.tmp', self.prometheus_path)
+
+class PngRenderer:
+    """Servidor Kaleido persistente: Chromium queda abierto entre reruns y sesiones.
+
+    Si Chrome no está disponible, ``warm`` queda en False y las imágenes se generan con
+    ``render_once``, la exportación directa de plotly, que informa su propio error.
+    """
+
+    def __init__(self, workers: int):
+        # Las herramientas del navegador se importan solo aquí: el núcleo no las necesita para analizar
+        import kaleido
+        from choreographer.browsers.chromium import Chromium
+
+        self._lock = threading.Lock()
+        self.warm = False
+        # Sin Chrome el servidor de fondo moriría y dejaría las llamadas esperando: se busca antes con la
+        # misma búsqueda que usa kaleido, sin crear un navegador de prueba que después haya que cerrar
+        browser = Chromium.find_browser(skip_local=False)
+        if not browser or not os.path.isfile(browser):
+            logger.info("Kaleido no encontró Chrome; las imágenes PNG se generarán sin el servidor persistente.")
+            return
+        try:
+            kaleido.start_sync_server(n=workers, silence_warnings=True)
+            self.warm = True
+        except Exception as e:
+            logger.warning(f"No se pudo iniciar el servidor de Kaleido: {str(e)}")
+
+    def render(self, fig_json: str) -> bytes:
+        # El servidor atiende una solicitud a la vez; las páginas de Chromium ya están cargadas
+        with self._lock:
+            return self.render_once(fig_json)
+
+    @staticmethod
+    def render_once(fig_json: str) -> bytes:
+        import plotly.io as pio
+        return pio.to_image(json.loads(fig_json), format="png", scale=CONFIG['exports']['png_scale'])
+
+# Funciones auxiliares
+PDF_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 12),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+])
+
+def pdf_column_widths(data: pd.DataFrame, header: list) -> list:
+    # Ancho de cada columna desde su valor más largo en todo el frame (no una muestra), medido con la
+    # fuente de la tabla; más el relleno izquierdo y derecho de la celda
+    widths = []
+    for i, name in enumerate(header):
+        text = data.iloc[:, i].astype(str)
+        longest = text.iloc[int(text.str.len().to_numpy().argmax())] if len(text) else ''
+        widths.append(max(stringWidth(str(name), 'Helvetica-Bold', 12), stringWidth(longest, 'Helvetica', 10)) + 12)
+    return widths
+
+class StreamingTable(Flowable):
+    """Tabla que se maqueta por bloques mientras se arma el documento.
+
+    Cada bloque lleva el encabezado y exactamente las filas que caben en el espacio libre que el
+    marco le ofrece a ``split``; el resto sigue como otra StreamingTable, así que solo un bloque
+    vive en memoria.
+    """
+
+    def __init__(self, data: pd.DataFrame, position: int = 0, layout: tuple = None):
+        super().__init__()
+        self.data = data
+        self.position = position
+        self.header = data.columns.tolist()
+        self.hAlign = 'CENTER'
+        if layout is None:
+            # Alto del encabezado y de una fila, de las dimensiones que devuelve wrap() en tablas de prueba
+            widths = pdf_column_widths(data, self.header)
+            _, header_height = self.block([], widths).wrap(0, 0)
+            _, probe_height = self.block([self.header], widths).wrap(0, 0)
+            layout = (widths, header_height, probe_height - header_height)
+        self.layout = layout
+
+    def block(self, rows: list, widths: list = None) -> Table:
+        table = Table([self.header] + rows, colWidths=widths or self.layout[0], repeatRows=1)
+        table.setStyle(PDF_TABLE_STYLE)
+        return table
+
+    def rows(self, count: int) -> list:
+        return self.data.iloc[self.position:self.position + count].values.tolist()
+
+    def wrap(self, availWidth, availHeight):
+        widths, header_height, row_height = self.layout
+        self.width = sum(widths)
+        self.height = header_height + (len(self.data) - self.position) * row_height
+        return self.width, self.height
+
+    def split(self, availWidth, availHeight):
+        _, header_height, row_height = self.layout
+        count = int((availHeight - header_height) // row_height)
+        if count < 1:
+            return []
+        return [self.block(self.rows(count)), StreamingTable(self.data, self.position + count, self.layout)]
+
+    def draw(self):
+        table = self.block(self.rows(len(self.data) - self.position))
+        table.wrapOn(self.canv, self.width, self.height)
+        table.drawOn(self.canv, 0, 0)
+
+def build_pdf(data: pd.DataFrame, title: str) -> bytes:
+    # El PDF se escribe en un archivo temporal (en memoria solo hasta spool_max_bytes)
+    with tempfile.SpooledTemporaryFile(max_size=CONFIG['exports']['spool_max_bytes']) as spool:
+        doc = SimpleDocTemplate(spool, pagesize=letter)
+        elements = []
+        styles = getSampleStyleSheet()
+
+        try:
+            logo = Image("app/data/logo.png", width=100, height=50)
+            elements.append(logo)
+        except Exception as e:
+            elements.append(Paragraph("Logo no disponible", styles['Normal']))
+
+        elements.append(Paragraph(title, styles['Title']))
+        elements.append(Paragraph(" ", styles['Normal']))
+        if data.empty:
+            table = Table([data.columns.tolist()])
+            table.setStyle(PDF_TABLE_STYLE)
+            elements.append(table)
+        else:
+            elements.append(StreamingTable(data))
+        doc.build(elements)
+        spool.seek(0)
+        return spool.read()
+
+def build_excel(data: pd.DataFrame, sheet_name: str) -> bytes:
+    if len(data) > CONFIG['exports']['excel_stream_rows']:
+        return write_excel_streaming(data, sheet_name)
+
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
+        data.to_excel(writer, sheet_name=sheet_name, index=False)
+        workbook = writer.book
+        worksheet = writer.sheets[sheet_name]
+        header_fmt = workbook.add_format({'bold': True, 'bg_color': '#D3D3D3'})
+        for col_num, value in enumerate(data.columns.values):
+            worksheet.write(0, col_num, value, header_fmt)
+        worksheet.autofit()
+    return buffer.getvalue()
+
+def excel_column_widths(data: pd.DataFrame) -> list:
+    # Anchos desde el tipo de la columna o desde una muestra, sin recorrer todas las celdas como autofit()
+    sample = data.iloc[:CONFIG['exports']['excel_sample_rows']]
+    widths = []
+    for col in data.columns:
+        if pd.api.types.is_datetime64_any_dtype(data[col]):
+            width = 19
+        else:
+            width = sample[col].astype(str).str.len().max() if not sample.empty else 0
+        widths.append(min(max(width, len(str(col))) + 2, 60))
+    return widths
+
+def write_excel_streaming(data: pd.DataFrame, sheet_name: str) -> bytes:
+    # Modo para exportaciones grandes: xlsxwriter en constant_memory escribe fila por fila a disco,
+    # los datos se convierten por bloques y el libro final se guarda en un archivo temporal
+    rows_per_sheet = CONFIG['exports']['excel_max_rows'] - 1
+    chunk_rows = CONFIG['exports']['excel_chunk_rows']
+    widths = excel_column_widths(data)
+    with tempfile.SpooledTemporaryFile(max_size=CONFIG['exports']['spool_max_bytes']) as spool:
+        workbook = xlsxwriter.Workbook(spool, {'constant_memory': True, 'default_date_format': 'yyyy-mm-dd hh:mm:ss'})
+        header_fmt = workbook.add_format({'bold': True, 'bg_color': '#D3D3D3'})
+        for sheet_num, sheet_start in enumerate(range(0, max(len(data), 1), rows_per_sheet)):
+            # Excel admite ~1M filas por hoja: el resto continúa en hojas numeradas
+            name = sheet_name if sheet_num == 0 else f"{sheet_name[:26]} ({sheet_num + 1})"
+            worksheet = workbook.add_worksheet(name)
+            for col_num, width in enumerate(widths):
+                worksheet.set_column(col_num, col_num, width)
+            worksheet.write_row(0, 0, [str(col) for col in data.columns], header_fmt)
+            row = 1
+            sheet_end = min(sheet_start + rows_per_sheet, len(data))
+            for start in range(sheet_start, sheet_end, chunk_rows):
+                chunk = data.iloc[start:min(start + chunk_rows, sheet_end)]
+                values = chunk.astype(object).where(chunk.notna(), None).values.tolist()
+                for record in values:
+                    worksheet.write_row(row, 0, record)
+                    row += 1
+        workbook.close()
+        spool.seek(0)
+        return spool.read()
+
+# Caché columnar en disco del libro de Excel ya limpio
+def file_fingerprint(path: str, with_hash: bool = False) -> dict:
+    stat = os.stat(path)
+    fingerprint = {
+        'source': os.path.abspath(path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'version': CONFIG['data']['cache_version']
+    }
+    if with_hash:
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        fingerprint['content_hash'] = digest.hexdigest()
+    return fingerprint
+
+def sidecar_paths(path: str) -> tuple:
+    key = hashlib.blake2b(os.path.abspath(path).encode('utf-8'), digest_size=8).hexdigest()
+    stem = os.path.join(CONFIG['data']['cache_dir'], f"{os.path.splitext(os.path.basename(path))[0]}.{key}")
+    return f"{stem}.parquet", f"{stem}.json"
+
+def read_sidecar(path: str):
+    parquet_path, meta_path = sidecar_paths(path)
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        current = file_fingerprint(path)
+        same_stat = all(meta.get(k) == current[k] for k in ('source', 'size', 'mtime_ns', 'version'))
+        if not same_stat:
+            # El archivo fue tocado o copiado: solo se re-procesa si cambió su contenido
+            current = file_fingerprint(path, with_hash=True)
+            if meta.get('content_hash') != current['content_hash'] or meta.get('version') != current['version']:
+                return None
+            meta.update(current)
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+        return pd.read_parquet(parquet_path, engine='pyarrow', memory_map=True)
+    except (OSError, ValueError):
+        return None
+
+def write_sidecar(df: pd.DataFrame, path: str):
+    parquet_path, meta_path = sidecar_paths(path)
+    try:
+        os.makedirs(CONFIG['data']['cache_dir'], exist_ok=True)
+        meta = file_fingerprint(path, with_hash=True)
+        meta['rows'] = len(df)
+        df.to_parquet(parquet_path + '.tmp', engine='pyarrow', index=False)
+        os.replace(parquet_path + '.tmp', parquet_path)
+        with open(meta_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + '.tmp', meta_path)
+    except Exception as e:
+        # La caché es opcional: si no se puede escribir se sigue con los datos en memoria
+        logger.info(f"No se pudo guardar la caché de datos: {str(e)}")
+
+# Lectura en streaming del libro: solo las columnas usadas y con tipos asignados al leer
+def typed_column(name: str, values: list) -> pd.Series:
+    dtypes = CONFIG['dtypes']
+    if name in dtypes['numeric']:
+        return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').astype('float64')
+    if name in dtypes['categorical']:
+        return pd.Series(pd.Categorical([v if v is None or isinstance(v, str) else str(v) for v in values]))
+    if name in dtypes['datetime']:
+        present = [v for v in values if v is not None]
+        if present and all(isinstance(v, datetime) for v in present):
+            return pd.Series(pd.to_datetime(values))
+        # Fechas como número de serie de Excel o texto: se convierten en add_day_of_week
+    return pd.Series(values)
+
+def read_pos_workbook(path: str) -> pd.DataFrame:
+    wanted = {col.strip().lower() for col in list(CONFIG['columns'].values()) + CONFIG['required_columns']}
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None) or ()
+        keep = {}
+        for i, name in enumerate(header):
+            if name is not None and str(name).strip().lower() in wanted and str(name) not in keep.values():
+                keep[i] = str(name)
+        columns = {i: [] for i in keep}
+        for row in rows:
+            values = [row[i] if i < len(row) else None for i in keep]
+            if all(v is None for v in values):
+                continue
+            for i, value in zip(keep, values):
+                columns[i].append(value)
+    finally:
+        workbook.close()
+    return pd.DataFrame({name: typed_column(name, columns[i]) for i, name in keep.items()})
+
+# Dimensiones categóricas: un diccionario por columna y códigos enteros por fila
+def encode_dimension(series: pd.Series, normalize=None) -> pd.Series:
+    categorical = series if isinstance(series.dtype, pd.CategoricalDtype) else series.astype('category')
+    categories = pd.Index(categorical.cat.categories.astype(str))
+    if normalize is not None:
+        # La normalización se aplica una sola vez sobre el diccionario, no sobre cada fila
+        categories = pd.Index(normalize(categories))
+    new_codes, uniques = pd.factorize(categories, sort=True)
+    codes = categorical.cat.codes.to_numpy()
+    codes = np.where(codes >= 0, new_codes[codes], -1) if len(new_codes) else codes
+    return pd.Series(pd.Categorical.from_codes(codes, categories=uniques), index=series.index, name=series.name)
+
+def category_mask(series: pd.Series, value) -> np.ndarray:
+    categories = series.cat.categories
+    if value not in categories:
+        return np.zeros(len(series), dtype=bool)
+    return series.cat.codes.to_numpy() == categories.get_loc(value)
+
+def category_options(series: pd.Series) -> list:
+    codes = series.cat.codes.to_numpy()
+    used = np.bincount(codes[codes >= 0], minlength=len(series.cat.categories)) > 0
+    return sorted(series.cat.categories[used].astype(str).tolist())
+
+def top_per_group(counts: pd.DataFrame, weight: str) -> pd.Series:
+    # Moda vectorizada: tabla grupo × ítem ya agregada, argmax por grupo; los empates se resuelven
+    # por orden alfabético del ítem, igual que Series.mode()
+    group, item = counts.index.names
+    counts = counts[weight].reset_index()
+    categories = counts[item].cat.categories
+    item_rank = np.empty(len(categories), dtype=np.int64)
+    item_rank[np.argsort(categories.astype(str).to_numpy(), kind='stable')] = np.arange(len(categories))
+    order = np.lexsort((item_rank[counts[item].cat.codes.to_numpy()], -counts[weight].to_numpy(),
+                        counts[group].cat.codes.to_numpy()))
+    top = counts.iloc[order].drop_duplicates(group)
+    return top.set_index(group)[item].astype(str)
+
+# Visor de datos crudos paginado en el servidor: solo la página visible se envía al navegador
+def sort_positions(series: pd.Series, descending: bool = False) -> np.ndarray:
+    values = series.reset_index(drop=True)
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # Las categorías se ordenan por su texto y no por su código de diccionario
+        categories = values.cat.categories
+        rank = np.argsort(np.argsort(categories.astype(str).to_numpy(), kind='stable'), kind='stable')
+        codes = values.cat.codes.to_numpy()
+        values = pd.Series(np.where(codes >= 0, rank[np.maximum(codes, 0)], np.nan))
+    return values.sort_values(ascending=not descending, kind='stable', na_position='last').index.to_numpy()
+
+def raw_data_page(frame: pd.DataFrame, order, columns: list, page: int, page_size: int) -> pd.DataFrame:
+    start = (page - 1) * page_size
+    if order is None:
+        return frame.iloc[start:start + page_size][columns]
+    return frame.take(order[start:start + page_size])[columns]
+
+class FilterIndex:
+    """Listas de posiciones por valor de cada dimensión, construidas una vez por versión del dataset."""
+
+    def __init__(self, df: pd.DataFrame, dimensions: list):
+        self.n_rows = len(df)
+        self.codes, self.order, self.offsets, self.categories = {}, {}, {}, {}
+        for col in dimensions:
+            codes = df[col].cat.codes.to_numpy()
+            order = np.argsort(codes, kind='stable')
+            self.codes[col] = codes
+            self.order[col] = order
+            self.offsets[col] = np.searchsorted(codes[order], np.arange(len(df[col].cat.categories) + 1))
+            self.categories[col] = df[col].cat.categories
+
+    def postings(self, col: str, value) -> np.ndarray:
+        categories = self.categories[col]
+        if value not in categories:
+            return np.empty(0, dtype=self.order[col].dtype)
+        code = categories.get_loc(value)
+        return self.order[col][self.offsets[col][code]:self.offsets[col][code + 1]]
+
+    def select(self, selections: dict, row_range: tuple = None):
+        # None significa "todas las filas" y un slice es un rango contiguo de fechas: ninguno copia el dataset
+        lo, hi = row_range if row_range is not None else (0, self.n_rows)
+        if not selections:
+            return None if (lo, hi) == (0, self.n_rows) else slice(lo, hi)
+        # Se parte de la lista más corta y el resto de condiciones se comprueban sobre sus códigos
+        postings = sorted(((self.postings(col, value), col, value) for col, value in selections.items()), key=lambda p: len(p[0]))
+        rows = postings[0][0]
+        rows = rows[np.searchsorted(rows, lo):np.searchsorted(rows, hi)]
+        if len(rows) == 0:
+            return rows
+        for _, col, value in postings[1:]:
+            rows = rows[self.codes[col][rows] == self.categories[col].get_loc(value)]
+        return rows
+
+class DateIndex:
+    """Fechas ordenadas con límites diarios: un rango de días se resuelve con búsqueda binaria."""
+
+    def __init__(self, fechas: pd.Series):
+        values = fechas.to_numpy()
+        self.n_rows = len(values)
+        self.days, offsets = np.unique(values.astype('datetime64[D]'), return_index=True)
+        self.day_offsets = np.append(offsets, self.n_rows)
+
+    def day_range(self, start, end) -> tuple:
+        first = np.searchsorted(self.days, np.datetime64(start, 'D'), side='left')
+        last = np.searchsorted(self.days, np.datetime64(end, 'D'), side='right')
+        return int(self.day_offsets[first]), int(self.day_offsets[max(last, first)])
+
+WEEKDAYS = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
+
+def cube_cells(df: pd.DataFrame) -> tuple:
+    # Celdas del cubo de un conjunto de filas y sus pares celda-recibo. El recibo se guarda como hash de
+    # 64 bits: los pares de particiones distintas se combinan sin un diccionario de recibos común
+    dims = CONFIG['cube']['dimensions']
+    measures = CONFIG['cube']['measures']
+    grouped = df.groupby([df['Fecha'].dt.normalize()] + [df[col] for col in dims], observed=True, sort=True)
+    cells = grouped[measures].sum()
+    cells['Líneas'] = grouped.size()
+    valid = df['Número de recibo'].notna().to_numpy()
+    pairs = pd.DataFrame({
+        'celda': grouped.ngroup().to_numpy().astype(np.int64)[valid],
+        'recibo': pd.util.hash_pandas_object(df['Número de recibo'][valid], index=False).to_numpy()
+    }).drop_duplicates()
+    return cells.reset_index(), pairs.reset_index(drop=True)
+
+class SalesCube:
+    """Cubo diario pre-agregado (día × producto × grupo × cliente × centro de costos) con medidas aditivas."""
+
+    def __init__(self, df: pd.DataFrame):
+        cells, pairs = cube_cells(df)
+        self.assemble(cells, pairs['celda'].to_numpy(), pairs['recibo'].to_numpy())
+
+    @classmethod
+    def from_cells(cls, cells: pd.DataFrame, pairs: pd.DataFrame) -> 'SalesCube':
+        # Celdas ya calculadas por partición (ver write_month_parts), sin recorrer las filas. Las
+        # exportaciones solapadas dejan varias particiones por mes con celdas repetidas: se reagregan
+        grouped = cells.groupby(['Fecha'] + CONFIG['cube']['dimensions'], observed=True, sort=True)
+        merged_ids = grouped.ngroup().to_numpy().astype(np.int64)
+        cube = cls.__new__(cls)
+        cube.assemble(grouped[CONFIG['cube']['measures'] + ['Líneas']].sum().reset_index(),
+                      merged_ids[pairs['celda'].to_numpy()], pairs['recibo'].to_numpy())
+        return cube
+
+    def assemble(self, cells: pd.DataFrame, pair_cells: np.ndarray, pair_receipts: np.ndarray):
+        self.cells = cells
+        self.cells['Día de la Semana'] = pd.Categorical.from_codes(
+            self.cells['Fecha'].dt.dayofweek.to_numpy(), categories=WEEKDAYS
+        )
+        self.cells['Mes'] = self.cells['Fecha'].dt.to_period('M')
+        self.days = self.cells['Fecha'].to_numpy()
+
+        # Conjuntos de recibos por celda (pares celda-recibo únicos, ordenados por celda): se combinan
+        # entre celdas sin perder exactitud, así que los conteos de órdenes coinciden con nunique()
+        receipts, receipt_values = pd.factorize(pair_receipts)
+        n_receipts = max(len(receipt_values), 1)
+        unique_pairs = np.unique(pair_cells * n_receipts + receipts)
+        self.pair_cell = unique_pairs // n_receipts
+        self.pair_receipt = unique_pairs % n_receipts
+
+    def select(self, date_range=None, selections: dict = None) -> np.ndarray:
+        lo, hi = 0, len(self.cells)
+        if date_range is not None:
+            start, end = date_range
+            lo = np.searchsorted(self.days, np.datetime64(start, 'D'), side='left')
+            hi = np.searchsorted(self.days, np.datetime64(end, 'D') + np.timedelta64(1, 'D'), side='left')
+        cells = np.arange(lo, max(hi, lo))
+        for col, value in (selections or {}).items():
+            cells = cells[category_mask(self.cells[col].iloc[cells], value)]
+        return cells
+
+    def view(self, cells: np.ndarray) -> pd.DataFrame:
+        return self.cells.iloc[cells]
+
+    def rollup(self, cells: np.ndarray, by, measures: list = None) -> pd.DataFrame:
+        measures = measures or CONFIG['cube']['measures'] + ['Líneas']
+        return self.view(cells).groupby(by, observed=True)[measures].sum()
+
+    def totals(self, cells: np.ndarray) -> pd.Series:
+        return self.view(cells)[CONFIG['cube']['measures'] + ['Líneas']].sum()
+
+    def facets(self, date_range=None, selections: dict = None, dimensions: list = None) -> dict:
+        """Opciones válidas de cada dimensión con sus líneas e ingresos, aplicando los demás filtros.
+
+        El filtro propio de cada dimensión no se aplica a sus opciones, así un desplegable sigue
+        ofreciendo sus alternativas mientras los demás se reducen en cascada.
+        """
+        selections = selections or {}
+        cells = self.select(date_range)
+        matches = {col: category_mask(self.cells[col].iloc[cells], value) for col, value in selections.items()}
+        lines = self.cells['Líneas'].to_numpy()[cells]
+        revenue = self.cells['Total Final'].to_numpy()[cells]
+        facets = {}
+        for col in dimensions or list(selections):
+            keep = np.ones(len(cells), dtype=bool)
+            for other, mask in matches.items():
+                if other != col:
+                    keep &= mask
+            categories = self.cells[col].cat.categories
+            codes = self.cells[col].cat.codes.to_numpy()[cells][keep]
+            counts = pd.DataFrame({
+                'Líneas': np.bincount(codes, weights=lines[keep], minlength=len(categories)).astype(np.int64),
+                'Total Final': np.bincount(codes, weights=revenue[keep], minlength=len(categories))
+            }, index=categories.astype(str))
+            # Mismo orden alfabético que category_options; solo las opciones con ventas en la selección
+            present = np.bincount(codes, minlength=len(categories)) > 0
+            facets[col] = counts[present].sort_index()
+        return facets
+
+    def distinct_receipts(self, cells: np.ndarray, by: str = None):
+        selected = np.zeros(len(self.cells), dtype=bool)
+        selected[cells] = True
+        in_cells = selected[self.pair_cell]
+        if by is None:
+            return int(np.unique(self.pair_receipt[in_cells]).size)
+        groups = self.cells[by].iloc[self.pair_cell[in_cells]]
+        pairs = pd.DataFrame({by: groups.to_numpy(), 'recibo': self.pair_receipt[in_cells]}).drop_duplicates()
+        return pairs.groupby(by, observed=True).size()
+
+# Pronósticos sobre la matriz días × series del cubo
+def daily_panel(cube: SalesCube, cells: np.ndarray, by: str = 'total') -> pd.DataFrame:
+    # Matriz días × series con los ingresos diarios (Total Final); todas las series se ajustan juntas
+    if by == 'total':
+        return cube.rollup(cells, 'Fecha', ['Total Final'])['Total Final'].to_frame('Total')
+    dimension = CONFIG['forecast']['dimensions'][by]
+    return forecasting.stack_series(cube.rollup(cells, ['Fecha', dimension], ['Total Final'])['Total Final'])
+
+def forecast_panel(panel: pd.DataFrame, model: str, cache: forecasting.ModelCache = None) -> pd.DataFrame:
+    settings = CONFIG['forecast']
+    if cache is None:
+        cache = forecasting.ModelCache(settings['cache_entries'])
+    if model == 'ets':
+        return cache.ets(panel, settings['horizon'], settings['alpha'], settings['workers'])
+    return cache.trend(panel, settings['horizon'], settings['degree'], settings['alpha'])
+
+def backtest_metrics(panel: pd.DataFrame, model: str, horizon: int, min_train: int) -> pd.DataFrame:
+    folds = backtesting.backtest(panel, model, horizon, min_train, CONFIG['backtest']['step'], CONFIG['forecast']['workers'])
+    return backtesting.horizon_metrics(folds)
+
+# Detección vectorizada de duplicados: orden por (cliente, producto, ventana, fecha) y comparación de filas adyacentes
+DAY_NS = 24 * 3600 * 10**9
+
+def find_duplicates(frame: pd.DataFrame, products: list, window: str = 'day', hours: float = None) -> tuple:
+    product_codes = frame['Líneas de la orden'].cat.codes.to_numpy()
+    wanted = frame['Líneas de la orden'].cat.categories.get_indexer(products)
+    rows = np.flatnonzero(np.isin(product_codes, wanted[wanted >= 0]))
+    if len(rows) < 2:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.int64)
+
+    clients = frame['Cliente/Nombre'].cat.codes.to_numpy()[rows]
+    product_codes = product_codes[rows]
+    times = frame['Fecha'].to_numpy()[rows].astype('datetime64[ns]').view('int64')
+    if window == 'hours':
+        buckets = np.zeros(len(rows), dtype=np.int64)
+    else:
+        buckets = times // DAY_NS
+        if window == 'shift':
+            starts = np.array([start for start, _ in CONFIG['duplicates']['shifts']]) * 3600 * 10**9
+            shift = np.searchsorted(starts, times % DAY_NS, side='right') - 1
+            buckets = buckets * len(starts) + shift
+
+    order = np.lexsort((times, buckets, product_codes, clients))
+    clients, product_codes, buckets, times = clients[order], product_codes[order], buckets[order], times[order]
+    same = (clients[1:] == clients[:-1]) & (product_codes[1:] == product_codes[:-1]) & (buckets[1:] == buckets[:-1])
+    if window == 'hours':
+        # Ventana deslizante: cada línea se encadena con la anterior si ocurre dentro de N horas
+        same &= np.diff(times) <= hours * 3600 * 10**9
+    flagged = np.zeros(len(order), dtype=bool)
+    flagged[1:] |= same
+    flagged[:-1] |= same
+    groups = np.cumsum(np.concatenate(([True], ~same)))
+
+    positions, groups = rows[order][flagged], groups[flagged]
+    original = np.argsort(positions, kind='stable')
+    return positions[original], groups[original]
+
+def duplicate_report(frame: pd.DataFrame, positions: np.ndarray, groups: np.ndarray, window: str, products: list) -> tuple:
+    dup = frame.take(positions).assign(Grupo=groups)
+    spec = {'Cliente/Nombre': ('Cliente/Nombre', 'first')}
+    if len(products) > 1:
+        spec['Producto'] = ('Líneas de la orden', 'first')
+    if window == 'hours':
+        spec['Desde'] = ('Fecha', 'min')
+        spec['Hasta'] = ('Fecha', 'max')
+    else:
+        dup['Fecha_Dia'] = dup['Fecha'].dt.date
+        spec['Fecha_Dia'] = ('Fecha_Dia', 'first')
+        if window == 'shift':
+            starts = [start for start, _ in CONFIG['duplicates']['shifts']]
+            labels = [label for _, label in CONFIG['duplicates']['shifts']]
+            dup['Turno'] = pd.Categorical.from_codes(np.searchsorted(starts, dup['Fecha'].dt.hour, side='right') - 1, labels)
+            spec['Turno'] = ('Turno', 'first')
+    summary = dup.groupby('Grupo').agg(**spec, Cantidad=('Grupo', 'size'))
+    summary = summary.astype({'Cliente/Nombre': str}).sort_values(list(spec), kind='stable').reset_index(drop=True)
+    return dup, summary
+
+# Ingesta incremental de todas las exportaciones POS del directorio de datos
+def discover_exports(directory: str) -> list:
+    # Los archivos '~$...' son bloqueos temporales de Excel, no exportaciones
+    return sorted(
+        os.path.abspath(path) for path in glob.glob(os.path.join(directory, '*.xlsx'))
+        if not os.path.basename(path).startswith('~$')
+    )
+
+def line_keys(df: pd.DataFrame) -> np.ndarray:
+    return pd.util.hash_pandas_object(df[CONFIG['data']['line_identity']], index=False).to_numpy()
+
+def encode_with_dictionaries(frame: pd.DataFrame, dictionaries: dict) -> pd.DataFrame:
+    # Diccionario compartido por todo el dataset: los valores nuevos se agregan al final
+    # para que las particiones ya escritas conserven sus códigos
+    for col in frame.columns:
+        if not isinstance(frame[col].dtype, pd.CategoricalDtype):
+            continue
+        known = dictionaries.setdefault(col, [])
+        known_set = set(known)
+        known.extend(value for value in frame[col].cat.categories.astype(str) if value not in known_set)
+        frame[col] = frame[col].cat.set_categories(pd.Index(known))
+    return frame
+
+def same_export(recorded: dict, path: str) -> bool:
+    current = file_fingerprint(path)
+    if all(recorded.get(k) == current[k] for k in ('size', 'mtime_ns', 'version')):
+        return True
+    return recorded.get('content_hash') == file_fingerprint(path, with_hash=True)['content_hash']
+
+def dataset_dir() -> str:
+    return os.path.join(CONFIG['data']['cache_dir'], 'dataset')
+
+# Escrituras al directorio del dataset (ingesta y auditorías): una a la vez entre hilos y, con flock,
+# entre procesos. Las lecturas de vistas toman el candado compartido, así una ingesta no borra una
+# vista mientras otro proceso la abre. El archivo del candado queda fuera de dataset_dir(), que la
+# ingesta puede borrar entero al reconstruir.
+INGEST_LOCK = threading.Lock()
+
+@contextmanager
+def dataset_lock(exclusive: bool = True):
+    os.makedirs(CONFIG['data']['cache_dir'], exist_ok=True)
+    with open(os.path.join(CONFIG['data']['cache_dir'], 'dataset.lock'), 'a') as handle:
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        elif exclusive:
+            INGEST_LOCK.acquire()
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+            elif exclusive:
+                INGEST_LOCK.release()
+
+def read_manifest():
+    try:
+        with open(os.path.join(dataset_dir(), 'manifest.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+        return manifest if manifest.get('version') == CONFIG['data']['cache_version'] else None
+    except (OSError, ValueError):
+        return None
+
+def write_manifest(manifest: dict):
+    manifest['dataset_version'] = hashlib.blake2b(
+        json.dumps(manifest['parts'], sort_keys=True).encode('utf-8'), digest_size=16
+    ).hexdigest()
+    path = os.path.join(dataset_dir(), 'manifest.json')
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(path + '.tmp', path)
+
+def part_path(part: dict) -> str:
+    return os.path.join(dataset_dir(), f"mes={part['month']}", part['file'])
+
+def write_arrow(frame: pd.DataFrame, path: str):
+    # Nombre temporal por proceso y reemplazo atómico: otro lector puede estar escribiendo el mismo archivo
+    table = pa.Table.from_pandas(frame, preserve_index=False).combine_chunks()
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+def map_view(path: str) -> pa.Table:
+    return pa.ipc.open_file(pa.memory_map(path)).read_all()
+
+def cube_paths(part: dict) -> tuple:
+    # Celdas del cubo y pares celda-recibo de la partición, junto a su parquet. Van en Arrow IPC sin
+    # comprimir, como las vistas: un rango largo abre dos archivos por partición y se mapean sin decodificar
+    base = part_path(part)[:-len('.parquet')]
+    return base + '.celdas.arrow', base + '.recibos.arrow'
+
+def write_cube_cells(part: dict, frame: pd.DataFrame):
+    # Las dimensiones se guardan como códigos del diccionario del dataset: repetir las categorías en
+    # cada archivo (miles de clientes) costaría más que las celdas mismas al leer muchos meses
+    cells, pairs = cube_cells(frame)
+    cells = cells.assign(**{col: cells[col].cat.codes.astype(np.int32) for col in CONFIG['cube']['dimensions']})
+    for path, data in zip(cube_paths(part), (cells, pairs)):
+        write_arrow(data, path)
+
+def drop_ingested_lines(frame: pd.DataFrame, manifest: dict) -> pd.DataFrame:
+    # Solo las filas anteriores a la marca de agua pueden estar ya en el dataset
+    if manifest['watermark'] is None:
+        return frame
+    overlap = (frame['Fecha'] <= pd.Timestamp(manifest['watermark'])).to_numpy()
+    if not overlap.any():
+        return frame
+    since = frame['Fecha'][overlap].min()
+    stored = [
+        pd.read_parquet(part_path(part), engine='pyarrow', filters=[('Fecha', '>=', since)])
+        for part in manifest['parts'] if pd.Timestamp(part['max']) >= since
+    ]
+    stored = [part for part in stored if not part.empty]
+    if not stored:
+        return frame
+    duplicated = np.zeros(len(frame), dtype=bool)
+    duplicated[overlap] = np.isin(line_keys(frame[overlap]), np.concatenate([line_keys(part) for part in stored]))
+    return frame[~duplicated]
+
+def write_month_parts(frame: pd.DataFrame, manifest: dict, source: str):
+    # Cada exportación agrega un archivo por mes tocado; las particiones existentes no se reescriben
+    months = frame['Fecha'].dt.to_period('M')
+    touched = []
+    for month, part_frame in frame.groupby(months, sort=True):
+        part = {'month': str(month), 'file': f"part-{manifest['next_part']:05d}.parquet", 'source': source,
+                'rows': len(part_frame), 'min': part_frame['Fecha'].min().isoformat(),
+                'max': part_frame['Fecha'].max().isoformat()}
+        os.makedirs(os.path.dirname(part_path(part)), exist_ok=True)
+        part_frame.to_parquet(part_path(part), engine='pyarrow', index=False)
+        write_cube_cells(part, part_frame)
+        manifest['next_part'] += 1
+        manifest['parts'].append(part)
+        touched.append(part['month'])
+    return touched
+
+def ingest_exports(paths: list, load_export) -> tuple:
+    manifest = read_manifest()
+    stale = manifest is None or any(
+        path not in paths or not same_export(recorded, path) for path, recorded in manifest['files'].items()
+    )
+    if stale:
+        # Un archivo ya incorporado cambió o desapareció: se reconstruye desde las cachés por archivo
+        if os.path.isdir(dataset_dir()):
+            shutil.rmtree(dataset_dir())
+        os.makedirs(dataset_dir(), exist_ok=True)
+        manifest = {'version': CONFIG['data']['cache_version'], 'files': {}, 'parts': [], 'dictionaries': {},
+                    'watermark': None, 'next_part': 0}
+    new_paths = [path for path in paths if path not in manifest['files']]
+
+    added, touched = 0, set()
+    for path in new_paths:
+        frame = load_export(path)
+        fingerprint = file_fingerprint(path, with_hash=True)
+        if not frame.empty:
+            frame = drop_ingested_lines(frame, manifest)
+        if not frame.empty:
+            frame = encode_with_dictionaries(frame.copy(), manifest['dictionaries'])
+            touched.update(write_month_parts(frame, manifest, path))
+            watermark = frame['Fecha'].max()
+            if manifest['watermark'] is None or watermark > pd.Timestamp(manifest['watermark']):
+                manifest['watermark'] = watermark.isoformat()
+            added += len(frame)
+        manifest['files'][path] = {**fingerprint, 'rows': len(frame)}
+        write_manifest(manifest)
+    # Solo se reescriben las vistas de los meses que recibieron filas: el costo sigue al archivo nuevo
+    for month in sorted(touched):
+        write_view(manifest, month)
+    if touched:
+        prune_views(manifest)
+    return manifest, new_paths, added
+
+def dataset_bounds(manifest: dict) -> tuple:
+    return (min(pd.Timestamp(part['min']) for part in manifest['parts']),
+            max(pd.Timestamp(part['max']) for part in manifest['parts']))
+
+def overlapping_months(manifest: dict, date_range=None) -> tuple:
+    months = sorted({part['month'] for part in manifest['parts']})
+    if date_range is None:
+        return tuple(months)
+    first, last = (pd.Period(day, 'M') for day in date_range)
+    return tuple(month for month in months if first <= pd.Period(month, 'M') <= last)
+
+def read_partitions(manifest: dict, months: tuple) -> pd.DataFrame:
+    parts = [part for part in manifest['parts'] if part['month'] in months]
+    frames = [pd.read_parquet(part_path(part), engine='pyarrow', memory_map=True) for part in parts]
+    if not frames:
+        # Rango sin datos: se devuelve un dataset vacío con el mismo esquema
+        frames = [pd.read_parquet(part_path(manifest['parts'][0]), engine='pyarrow').iloc[0:0]]
+    dtypes = dictionary_dtypes(manifest)
+    for frame in frames:
+        apply_dictionaries(frame, dtypes)
+    return pd.concat(frames, ignore_index=True).sort_values('Fecha', kind='stable') if len(frames) > 1 else frames[0]
+
+def dictionary_dtypes(manifest: dict) -> dict:
+    # Se arman una vez por lectura: con miles de clientes, crear las categorías por archivo domina el tiempo
+    return {col: pd.CategoricalDtype(values) for col, values in manifest['dictionaries'].items()}
+
+def apply_dictionaries(frame: pd.DataFrame, dtypes: dict) -> pd.DataFrame:
+    # Los diccionarios solo crecen al final: los datos escritos antes se alinean con el actual
+    for col, dtype in dtypes.items():
+        if col in frame.columns and not frame[col].cat.categories.equals(dtype.categories):
+            frame[col] = frame[col].cat.set_categories(dtype.categories)
+    return frame
+
+# Vistas compartidas por mes: cada mes se guarda ya decodificado y ordenado en un archivo Arrow IPC sin
+# comprimir, escrito por la ingesta cuando el mes recibe filas. Al mapearlo, las columnas numéricas,
+# de fechas y de texto apuntan a las páginas del archivo, que el sistema operativo comparte entre
+# sesiones y procesos. Un rango de un mes se usa sin copia; varios meses se unen en Arrow y se
+# convierten a pandas una sola vez.
+def view_path(manifest: dict, month: str) -> str:
+    # El nombre sigue a las particiones del mes: un mes que recibe otra partición cambia de vista
+    files = [part['file'] for part in manifest['parts'] if part['month'] == month]
+    key = hashlib.blake2b(','.join(files).encode('utf-8'), digest_size=8).hexdigest()
+    return os.path.join(dataset_dir(), 'views', f"mes={month}-{key}.arrow")
+
+def write_view(manifest: dict, month: str):
+    path = view_path(manifest, month)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_arrow(read_partitions(manifest, (month,)), path)
+
+def prune_views(manifest: dict):
+    # Con el candado exclusivo: se borran las vistas que el manifiesto ya no referencia. Un proceso
+    # que aún tenga una mapeada conserva sus páginas hasta soltarla.
+    referenced = {view_path(manifest, month) for month in overlapping_months(manifest)}
+    for path in glob.glob(os.path.join(dataset_dir(), 'views', '*.arrow')):
+        if path not in referenced:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def read_dataset(manifest: dict, months: tuple) -> pd.DataFrame:
+    # Solo se abren los meses pedidos; la versión identifica el rango en las cachés
+    with span('read_partitions', meses=len(months)):
+        present = [month for month in overlapping_months(manifest) if month in months]
+        if not present:
+            # Rango sin datos: el dataset vacío con el mismo esquema no necesita vista
+            df = read_partitions(manifest, months)
+        else:
+            tables = []
+            with dataset_lock(exclusive=False):
+                for month in present:
+                    path = view_path(manifest, month)
+                    if not os.path.exists(path):
+                        # Dataset escrito antes de las vistas por mes: se crea la que falta
+                        write_view(manifest, month)
+                    tables.append(map_view(path))
+            # Convertir cada mes por separado repite la creación de las categorías y la unión de bloques;
+            # 'permissive' unifica los índices de diccionario que crecieron entre vistas (int8 -> int16)
+            table = tables[0] if len(tables) == 1 else pa.concat_tables(tables, promote_options='permissive')
+            df = apply_dictionaries(table.to_pandas(split_blocks=True), dictionary_dtypes(manifest))
+    df.attrs['dataset_version'] = f"{manifest['dataset_version']}:{','.join(months)}"
+    return df
+
+def read_cube(manifest: dict, months: tuple) -> SalesCube:
+    # El cubo de un rango se arma con las celdas guardadas de sus particiones, sin volver a las filas
+    parts = [part for part in manifest['parts'] if part['month'] in months]
+    if not parts:
+        return SalesCube(read_partitions(manifest, ()))
+    cell_tables, pair_tables, dtypes = [], [], dictionary_dtypes(manifest)
+    with dataset_lock(exclusive=False):
+        for part in parts:
+            cells_path, pairs_path = cube_paths(part)
+            if not (os.path.exists(cells_path) and os.path.exists(pairs_path)):
+                # Partición escrita antes de guardar las celdas: se calculan una vez desde su parquet
+                write_cube_cells(part, apply_dictionaries(pd.read_parquet(part_path(part), engine='pyarrow'), dtypes))
+            cell_tables.append(map_view(cells_path))
+            pair_tables.append(map_view(pairs_path))
+    # Como en read_dataset, las particiones se unen en Arrow y se convierten una sola vez; los pares
+    # pasan a apuntar a la fila de su celda en la tabla unida
+    cells = pa.concat_tables(cell_tables).to_pandas()
+    for col in CONFIG['cube']['dimensions']:
+        cells[col] = pd.Categorical.from_codes(cells[col], dtype=dtypes[col])
+    pairs = pa.concat_tables(pair_tables).to_pandas()
+    offsets = np.cumsum([0] + [len(table) for table in cell_tables[:-1]])
+    pairs['celda'] += np.repeat(offsets, [len(table) for table in pair_tables])
+    return SalesCube.from_cells(cells, pairs)
+
+def audit_paths(products: list, window: str, hours) -> tuple:
+    key = hashlib.blake2b(json.dumps([sorted(products), window, hours, CONFIG['duplicates']['shifts'],
+                                      CONFIG['data']['cache_version']]).encode('utf-8'), digest_size=8).hexdigest()
+    base = os.path.join(CONFIG['data']['cache_dir'], 'audits', key)
+    return base + '.parquet', base + '.json'
+
+def audit_history(manifest: dict, products: list, window: str, hours) -> pd.DataFrame:
+    # Auditoría de todo el historial: solo se revisan las particiones agregadas desde la última
+    # auditoría, junto con el margen de la ventana que las rodea. Como el dataset solo crece,
+    # una línea marcada como duplicada sigue siéndolo y los resultados se acumulan.
+    data_path, state_path = audit_paths(products, window, hours)
+    part_id = lambda part: f"{part['file']}|{part['source']}|{part['rows']}"
+    current = {part_id(part) for part in manifest['parts']}
+    state, flagged = {'parts': []}, None
+    if os.path.exists(state_path) and os.path.exists(data_path):
+        with open(state_path, encoding='utf-8') as f:
+            state = json.load(f)
+        if set(state['parts']) <= current:
+            flagged = pd.read_parquet(data_path, engine='pyarrow')
+        else:
+            # El dataset se reconstruyó: la auditoría empieza de nuevo
+            state = {'parts': []}
+    pending = [part for part in manifest['parts'] if part_id(part) not in set(state['parts'])]
+
+    pad = pd.Timedelta(hours=hours) if window == 'hours' else pd.Timedelta(0)
+    found = [] if flagged is None else [flagged]
+    for month in sorted({part['month'] for part in pending}):
+        new_parts = [part for part in pending if part['month'] == month]
+        start = min(pd.Timestamp(part['min']) for part in new_parts) - pad
+        end = max(pd.Timestamp(part['max']) for part in new_parts) + pad
+        if window != 'hours':
+            start, end = start.normalize(), end.normalize() + pd.Timedelta(days=1)
+        frame = read_partitions(manifest, overlapping_months(manifest, (start, end)))
+        frame = frame[(frame['Fecha'] >= start) & (frame['Fecha'] <= end)]
+        positions, _ = find_duplicates(frame, products, window, hours)
+        found.append(frame.take(positions))
+
+    if found:
+        result = pd.concat(found, ignore_index=True)
+        result = result[~pd.Index(line_keys(result)).duplicated()]
+    else:
+        result = read_partitions(manifest, ())
+    for col, values in manifest['dictionaries'].items():
+        if col in result.columns:
+            result[col] = result[col].astype(str).astype(pd.CategoricalDtype(values))
+    result = result.sort_values('Fecha', kind='stable').reset_index(drop=True)
+
+    if pending:
+        with dataset_lock():
+            os.makedirs(os.path.dirname(data_path), exist_ok=True)
+            result.to_parquet(data_path, engine='pyarrow', index=False)
+            with open(state_path, 'w', encoding='utf-8') as f:
+                json.dump({'parts': sorted(current)}, f)
+    return result
+
+# Limpieza de una exportación POS
+NORMALIZED_DIMENSIONS = ['Cliente/Nombre', 'Centro de Costos Aseavna']
+
+def load_excel(path):
+    try:
+        return read_pos_workbook(path)
+    except Exception as e:
+        logger.error(f"Error al cargar los datos: {str(e)}")
+        return pd.DataFrame()
+
+def validate_data(df):
+    missing_cols = [col for col in CONFIG['required_columns'] if col not in df.columns]
+    if missing_cols:
+        logger.error(f"Faltan las columnas: {', '.join(missing_cols)}")
+        return False
+    return True
+
+def map_columns(df):
+    df_columns = {col.strip().lower(): col for col in df.columns}
+    for expected_col, search_col in CONFIG['columns'].items():
+        found_col = df_columns.get(search_col.strip().lower())
+        if found_col == expected_col:
+            continue
+        if found_col:
+            df = df.rename(columns={found_col: expected_col})
+        else:
+            df[expected_col] = 'Desconocido' if 'Cliente' in expected_col or 'Líneas' in expected_col else 0
+    return df
+
+def calculate_total(df):
+    # Calcular Total Final como suma de Cuentas por a cobrar aseavna y Cuentas por a Cobrar Avna
+    df['Total Final'] = pd.to_numeric(df['Cuentas por a cobrar aseavna'], errors='coerce').fillna(0) + \
+                       pd.to_numeric(df['Cuentas por a Cobrar Avna'], errors='coerce').fillna(0)
+    return df
+
+def clean_data(df):
+    defaults = {
+        'Cliente/Código de barras': 'Desconocido',
+        'Cliente/Nombre': 'Desconocido',
+        'Centro de Costos Aseavna': 'Desconocido',
+        'Cliente/Nombre principal': 'Desconocido',
+        'Líneas de la orden': 'Desconocido'
+    }
+    for col, default in defaults.items():
+        if isinstance(df[col].dtype, pd.CategoricalDtype) and default not in df[col].cat.categories:
+            df[col] = df[col].cat.add_categories(default)
+        df[col] = df[col].fillna(default)
+    numeric_cols = ['Líneas de la orden/Cantidad', 'Total Final', 'Comision Aseavna', 'Cuentas por a cobrar aseavna', 
+                   'Cuentas por a Cobrar Avna', 'Precio total colaborador']
+    for col in numeric_cols:
+        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+    for col in NORMALIZED_DIMENSIONS:
+        df[col] = encode_dimension(df[col], lambda values: values.str.strip().str.lower())
+    for col in ['Cliente/Nombre principal', 'Líneas de la orden']:
+        df[col] = encode_dimension(df[col])
+    # Columnas con tipos mezclados (p. ej. códigos numéricos y 'Desconocido') se guardan como texto
+    for col in df.columns.drop('Fecha', errors='ignore'):
+        if df[col].dtype == object and pd.api.types.infer_dtype(df[col], skipna=True) not in ('string', 'empty'):
+            df[col] = df[col].astype(str)
+    return df
+
+def add_day_of_week(df):
+    original_rows = len(df)
+    logger.info(f"Filas cargadas inicialmente del archivo Excel: {original_rows}")
+
+    if pd.api.types.is_numeric_dtype(df['Fecha']):
+        df['Fecha'] = pd.to_datetime(df['Fecha'], unit='D', origin='1899-12-30', errors='coerce') - timedelta(days=2)
+    else:
+        df['Fecha'] = pd.to_datetime(df['Fecha'], format='%Y-%m-%d %H:%M:%S', errors='coerce')
+    
+    df['Fecha_Valida'] = df['Fecha'].notna()
+    invalid_dates = df['Fecha'].isna().sum()
+    if invalid_dates > 0:
+        logger.warning(f"Se encontraron {invalid_dates} fechas no válidas que se excluirán del análisis.")
+    
+    duplicates = df.duplicated().sum()
+    if duplicates > 0:
+        logger.warning(f"Se encontraron {duplicates} filas duplicadas en el archivo Excel. Se eliminarán.")
+        df = df.drop_duplicates()
+        logger.info(f"Filas después de eliminar duplicados: {len(df)}")
+    
+    df = df.dropna(subset=['Fecha'])
+    logger.info(f"Filas después de eliminar fechas no válidas: {len(df)}")
+
+    df['Día de la Semana'] = pd.Categorical.from_codes(df['Fecha'].dt.dayofweek.to_numpy(), categories=WEEKDAYS)
+    # El dataset se mantiene ordenado por fecha para resolver los rangos como slices contiguos
+    return df.sort_values('Fecha', kind='stable')
+
+def peak_rss_mb():
+    # Pico de memoria residente del proceso (ru_maxrss: KB en Linux, bytes en macOS); sin costo al medir
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 1024
+
+def load_export(path):
+    cached = read_sidecar(path)
+    if cached is not None:
+        return cached
+
+    rss_before = peak_rss_mb()
+    try:
+        with span('load_excel'):
+            df = load_excel(path)
+        if df.empty or not validate_data(df):
+            return pd.DataFrame()
+        with span('map_columns'):
+            df = map_columns(df)
+        with span('calculate_total'):
+            df = calculate_total(df)
+        with span('clean_data'):
+            df = clean_data(df)
+        with span('add_day_of_week'):
+            df = add_day_of_week(df)
+    finally:
+        if rss_before is not None:
+            # El pico es del proceso completo: la carga solo lo sube si supera el máximo anterior
+            rss_after = peak_rss_mb()
+            logger.info(f"Memoria RSS pico tras la carga de {os.path.basename(path)}: {rss_after:,.1f} MB "
+                        f"(+{rss_after - rss_before:,.1f} MB durante la carga)")
+    write_sidecar(df, path)
+    return df
+
+def load_dataset(directory: str = None) -> dict:
+    # Incorpora las exportaciones nuevas del directorio de datos y devuelve el manifiesto del dataset
+    paths = discover_exports(directory or CONFIG['data']['dir'])
+    with dataset_lock(), span('ingest_exports'):
+        manifest, new_paths, added = ingest_exports(paths, load_export)
+    logger.info(f"Exportaciones POS encontradas: {len(paths)} ({len(new_paths)} por incorporar)")
+    if new_paths:
+        logger.info(f"Filas incorporadas al dataset: {added}")
+    logger.info(f"Filas en el dataset: {sum(part['rows'] for part in manifest['parts'])}")
+    return manifest
+
+# Selecciones y tablas de reporte compartidas por el tablero y los trabajos por lotes
+def build_selections(values: dict) -> dict:
+    # 'Todos' o vacío no filtra; cliente y centro de costos se comparan normalizados, como en clean_data
+    selections = {}
+    for col, value in values.items():
+        if value is None or value == 'Todos':
+            continue
+        selections[col] = value.strip().lower() if col in NORMALIZED_DIMENSIONS else value
+    return selections
+
+def select_rows(df: pd.DataFrame, rows) -> pd.DataFrame:
+    # Resultado de FilterIndex.select: None (todo), slice (rango de fechas) o posiciones
+    if rows is None:
+        return df
+    if isinstance(rows, slice):
+        return df.iloc[rows]
+    return df.take(rows)
+
+def client_sales_table(cube: SalesCube, cells: np.ndarray) -> pd.DataFrame:
+    # Una sola agregación cliente × producto alimenta las medidas y el producto más comprado
+    client_products = cube.rollup(cells, ['Cliente/Nombre', 'Líneas de la orden'])
+    by_client = client_products.groupby(level='Cliente/Nombre', observed=True).sum()
+    client_sales = pd.DataFrame({
+        'Total Final': by_client['Total Final'],
+        'Número de recibo': cube.distinct_receipts(cells, by='Cliente/Nombre'),
+        'Comision Aseavna': by_client['Comision Aseavna'],
+        'Cuentas por a cobrar aseavna': by_client['Cuentas por a cobrar aseavna'],
+        'Cuentas por a Cobrar Avna': by_client['Cuentas por a Cobrar Avna'],
+        'Líneas de la orden': top_per_group(client_products, 'Líneas')
+    }).reset_index()
+    client_sales.columns = [
+        'Cliente',
+        'Ingresos Totales (₡)',
+        'Número de Órdenes',
+        'Comisión Total (₡)',
+        'Ctas. por Cobrar Aseavna (₡)',
+        'Ctas. por Cobrar Avna (₡)',
+        'Producto Más Comprado'
+    ]
+    return client_sales
+
+def summary_table(cube: SalesCube, cells: np.ndarray) -> pd.DataFrame:
+    totals = cube.totals(cells)
+    sales_by_product = cube.rollup(cells, 'Líneas de la orden', ['Total Final'])['Total Final']
+    report = {
+        "Número de Órdenes": cube.distinct_receipts(cells),
+        "Líneas Totales": int(totals['Líneas']),
+        "Comisión Total (₡)": totals['Comision Aseavna'],
+        "Ctas. por Cobrar Aseavna (₡)": totals['Cuentas por a cobrar aseavna'],
+        "Ctas. por Cobrar Avna (₡)": totals['Cuentas por a Cobrar Avna'],
+        "Clientes Únicos": len(category_options(cube.view(cells)['Cliente/Nombre'])),
+        "Producto Más Vendido": sales_by_product.idxmax() if not sales_by_product.empty else "N/A",
+        "Producto Menos Vendido": sales_by_product.idxmin() if not sales_by_product.empty else "N/A"
+    }
+    return pd.DataFrame([report])
@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sales_core import CONFIG, map_columns, calculate_total, clean_data, add_day_of_week  # noqa: E402
+from sales_benchmark import synthetic_orders  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def sales_frame():
+    # Exportación sintética limpia con el mismo pipeline que load_export, ordenada por fecha
+    df = synthetic_orders(4000, seed=1)
+    for step in (map_columns, calculate_total, clean_data, add_day_of_week):
+        df = step(df)
+    return df.reset_index(drop=True)
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    # Cada prueba escribe su dataset, cachés y auditorías en un directorio propio
+    monkeypatch.setitem(CONFIG['data'], 'cache_dir', str(tmp_path / 'cache'))
+    return tmp_path
@@ -0,0 +1,78 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sales_core import (
+    CONFIG, dataset_lock, ingest_exports, read_dataset, read_cube, overlapping_months, audit_history,
+    find_duplicates, line_keys, SalesCube
+)
+
+PRODUCTS = CONFIG['duplicates']['products']
+
+
+@pytest.fixture
+def exports(sales_frame, cache_dir):
+    # Dos exportaciones que se solapan en el medio del período, como dos descargas sucesivas de Odoo
+    dates = sales_frame['Fecha']
+    first = sales_frame[dates <= dates.quantile(0.6)].reset_index(drop=True)
+    second = sales_frame[dates >= dates.quantile(0.4)].reset_index(drop=True)
+    frames = {}
+    for name, frame in (('primera.xlsx', first), ('segunda.xlsx', second)):
+        path = str(cache_dir / name)
+        with open(path, 'w') as f:
+            f.write(name)
+        frames[path] = frame
+    return frames
+
+
+def ingest(frames: dict, paths: list) -> dict:
+    with dataset_lock():
+        manifest, _, _ = ingest_exports(paths, lambda path: frames[path].copy())
+    return manifest
+
+
+def test_ingest_drops_lines_already_ingested(sales_frame, exports):
+    first, second = exports
+    assert not pd.Index(line_keys(sales_frame)).duplicated().any()
+
+    ingest(exports, [first])
+    with dataset_lock():
+        manifest, new_paths, added = ingest_exports([first, second], lambda path: exports[path].copy())
+    overlap = np.isin(line_keys(exports[second]), line_keys(exports[first])).sum()
+    assert overlap > 0
+    assert new_paths == [second] and added == len(exports[second]) - overlap
+
+    dataset = read_dataset(manifest, overlapping_months(manifest))
+    assert len(dataset) == len(sales_frame)
+    np.testing.assert_array_equal(np.sort(line_keys(dataset)), np.sort(line_keys(sales_frame)))
+    assert dataset['Fecha'].is_monotonic_increasing
+
+
+def test_read_cube_matches_cube_from_rows(exports):
+    manifest = ingest(exports, list(exports))
+    for months in (overlapping_months(manifest), overlapping_months(manifest)[1:2]):
+        from_rows = SalesCube(read_dataset(manifest, months))
+        stored = read_cube(manifest, months)
+        pd.testing.assert_frame_equal(stored.cells, from_rows.cells)
+        cells = stored.select()
+        assert stored.distinct_receipts(cells) == from_rows.distinct_receipts(cells)
+
+
+@pytest.mark.parametrize('window, hours', [('day', None), ('hours', 4)])
+def test_audit_history_incremental_matches_full(exports, window, hours):
+    first, second = exports
+    audit_history(ingest(exports, [first]), PRODUCTS, window, hours)
+    manifest = ingest(exports, [first, second])
+    incremental = audit_history(manifest, PRODUCTS, window, hours)
+
+    shutil.rmtree(os.path.join(CONFIG['data']['cache_dir'], 'audits'))
+    full = audit_history(manifest, PRODUCTS, window, hours)
+    pd.testing.assert_frame_equal(incremental, full)
+
+    dataset = read_dataset(manifest, overlapping_months(manifest))
+    positions, _ = find_duplicates(dataset, PRODUCTS, window, hours)
+    assert len(positions) > 0
+    np.testing.assert_array_equal(np.sort(line_keys(full)), np.sort(line_keys(dataset.take(positions))))
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+
+from forecasting import TrendStats, forecast_trend
+
+
+def random_panel(days: int = 60) -> pd.DataFrame:
+    rng = np.random.default_rng(3)
+    index = pd.date_range('2025-01-01', periods=days, freq='D')
+    trend = np.arange(days)[:, None] * np.array([[15.0, -4.0, 0.5]])
+    return pd.DataFrame(1000 + trend + rng.normal(0, 50, (days, 3)), index=index, columns=['a', 'b', 'c'])
+
+
+def test_trend_stats_extend_matches_full_refit():
+    panel = random_panel()
+    stats = TrendStats(panel.index[0], 2, panel.columns).extend(panel.iloc[:40])
+    extended = stats.extend(panel)
+
+    assert stats.covers_prefix(panel) and extended.covers_prefix(panel)
+    pd.testing.assert_frame_equal(extended.forecast(7, 0.05), forecast_trend(panel, 7, 2, 0.05))
+    # El ajuste original no cambia al extenderlo
+    pd.testing.assert_frame_equal(stats.forecast(7, 0.05), forecast_trend(panel.iloc[:40], 7, 2, 0.05))
+
+
+def test_trend_stats_rejects_changed_history():
+    panel = random_panel()
+    stats = TrendStats(panel.index[0], 1, panel.columns).extend(panel.iloc[:40])
+    changed = panel.copy()
+    changed.iloc[10, 0] += 1
+    assert not stats.covers_prefix(changed)
+
+
+def test_forecast_trend_matches_polyfit():
+    panel = random_panel()
+    forecast = forecast_trend(panel, 7, 1, 0.05)
+    days = (panel.index - panel.index[0]).days.to_numpy(dtype=float)
+    future = days[-1] + np.arange(1, 8)
+    for col in panel.columns:
+        expected = np.polyval(np.polyfit(days, panel[col].to_numpy(), 1), future)
+        np.testing.assert_allclose(forecast.loc[forecast['Serie'] == col, 'Total'].to_numpy(), expected)
@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from sales_core import (
+    CONFIG, FilterIndex, DateIndex, SalesCube, find_duplicates, top_per_group, select_rows
+)
+
+PRODUCTS = CONFIG['duplicates']['products']
+
+
+def duplicate_keys(frame: pd.DataFrame, window: str) -> pd.DataFrame:
+    keys = pd.DataFrame({'cliente': frame['Cliente/Nombre'].astype(str),
+                         'producto': frame['Líneas de la orden'].astype(str),
+                         'dia': frame['Fecha'].dt.normalize()})
+    if window == 'shift':
+        hours = (frame['Fecha'] - frame['Fecha'].dt.normalize()) / pd.Timedelta(hours=1)
+        starts = [start for start, _ in CONFIG['duplicates']['shifts']]
+        keys['turno'] = np.searchsorted(starts, hours.to_numpy(), side='right') - 1
+    return keys
+
+
+@pytest.mark.parametrize('window', ['day', 'shift'])
+def test_find_duplicates_matches_duplicated(sales_frame, window):
+    positions, groups = find_duplicates(sales_frame, PRODUCTS, window)
+
+    in_products = sales_frame['Líneas de la orden'].isin(PRODUCTS).to_numpy()
+    keys = duplicate_keys(sales_frame, window)
+    expected = np.flatnonzero(in_products)[keys[in_products].duplicated(keep=False).to_numpy()]
+    assert len(expected) > 0
+    np.testing.assert_array_equal(positions, expected)
+
+    # Cada grupo reúne exactamente las líneas de una misma clave
+    flagged = keys.iloc[positions].assign(grupo=groups)
+    assert (flagged.groupby('grupo').nunique() == 1).all().all()
+    assert flagged['grupo'].nunique() == len(flagged.drop(columns='grupo').drop_duplicates())
+
+
+def test_find_duplicates_hours_window(sales_frame):
+    hours = 4
+    positions, groups = find_duplicates(sales_frame, PRODUCTS, 'hours', hours)
+
+    # Referencia por pares: una línea se marca si otra del mismo cliente y producto cae a N horas o menos
+    lines = sales_frame[sales_frame['Líneas de la orden'].isin(PRODUCTS)]
+    lines = pd.DataFrame({'cliente': lines['Cliente/Nombre'].astype(str), 'producto': lines['Líneas de la orden'].astype(str),
+                          'fecha': lines['Fecha'], 'fila': np.flatnonzero(sales_frame['Líneas de la orden'].isin(PRODUCTS))})
+    pairs = lines.merge(lines, on=['cliente', 'producto'])
+    pairs = pairs[(pairs['fila_x'] != pairs['fila_y'])
+                  & ((pairs['fecha_x'] - pairs['fecha_y']).abs() <= pd.Timedelta(hours=hours))]
+    expected = np.unique(pairs['fila_x'].to_numpy())
+    assert len(expected) > 0
+    np.testing.assert_array_equal(positions, expected)
+
+    # Dentro de un grupo, cada línea queda a N horas o menos de la anterior
+    chained = sales_frame.take(positions).assign(grupo=groups).sort_values(['grupo', 'Fecha'], kind='stable')
+    gaps = chained.groupby('grupo')['Fecha'].diff().dropna()
+    assert (gaps <= pd.Timedelta(hours=hours)).all()
+    assert (chained.groupby('grupo')['Cliente/Nombre'].nunique() == 1).all()
+
+
+def test_filter_index_select_with_row_range(sales_frame):
+    filter_index = FilterIndex(sales_frame, CONFIG['filter_dimensions'])
+    date_index = DateIndex(sales_frame['Fecha'])
+    days = sales_frame['Fecha'].dt.normalize().unique()
+    start, end = days[len(days) // 4], days[len(days) // 2]
+    in_range = ((sales_frame['Fecha'] >= start) & (sales_frame['Fecha'] < end + pd.Timedelta(days=1))).to_numpy()
+    row_range = date_index.day_range(start.date(), end.date())
+
+    group = sales_frame['Cliente/Nombre principal'].value_counts().index[0]
+    product = sales_frame['Líneas de la orden'].value_counts().index[0]
+    cases = [
+        ({}, in_range),
+        ({'Cliente/Nombre principal': group}, in_range & (sales_frame['Cliente/Nombre principal'] == group).to_numpy()),
+        ({'Cliente/Nombre principal': group, 'Líneas de la orden': product},
+         in_range & (sales_frame['Cliente/Nombre principal'] == group).to_numpy()
+         & (sales_frame['Líneas de la orden'] == product).to_numpy()),
+        ({'Líneas de la orden': 'Producto inexistente'}, np.zeros(len(sales_frame), dtype=bool)),
+    ]
+    for selections, mask in cases:
+        rows = filter_index.select(selections, row_range=row_range)
+        np.testing.assert_array_equal(select_rows(sales_frame, rows).index.to_numpy(), np.flatnonzero(mask))
+
+
+def test_sales_cube_facets_match_rows(sales_frame):
+    cube = SalesCube(sales_frame)
+    days = sales_frame['Fecha'].dt.normalize().unique()
+    date_range = (days[5].date(), days[-5].date())
+    selections = {
+        'Cliente/Nombre principal': sales_frame['Cliente/Nombre principal'].value_counts().index[0],
+        'Día de la Semana': 'Martes'
+    }
+    facets = cube.facets(date_range, selections, CONFIG['filter_dimensions'])
+
+    in_range = ((sales_frame['Fecha'] >= pd.Timestamp(date_range[0]))
+                & (sales_frame['Fecha'] < pd.Timestamp(date_range[1]) + pd.Timedelta(days=1)))
+    for col in CONFIG['filter_dimensions']:
+        # Las opciones de una dimensión aplican los demás filtros, no el propio
+        keep = in_range.copy()
+        for other, value in selections.items():
+            if other != col:
+                keep &= sales_frame[other] == value
+        rows = sales_frame[keep]
+        expected = pd.DataFrame({
+            'Líneas': rows.groupby(rows[col].astype(str)).size(),
+            'Total Final': rows.groupby(rows[col].astype(str))['Total Final'].sum()
+        }).sort_index()
+        assert len(expected) > 0
+        pd.testing.assert_frame_equal(facets[col], expected, check_names=False, check_dtype=False)
+
+
+def test_top_per_group_breaks_ties_like_mode():
+    # Códigos de diccionario en orden distinto al alfabético: el empate debe resolverse por el texto
+    items = pd.CategoricalDtype(['pinto', 'cafe', 'almuerzo'])
+    clients = pd.CategoricalDtype(['b', 'a'])
+    counts = pd.DataFrame({
+        'Cliente': pd.Categorical(['a', 'a', 'a', 'b', 'b'], dtype=clients),
+        'Producto': pd.Categorical(['pinto', 'cafe', 'almuerzo', 'pinto', 'cafe'], dtype=items),
+        'Líneas': [2, 2, 1, 3, 1]
+    }).set_index(['Cliente', 'Producto'])
+    top = top_per_group(counts, 'Líneas')
+    assert top.to_dict() == {'a': 'cafe', 'b': 'pinto'}
+
+
+def test_top_per_group_matches_mode(sales_frame):
+    cube = SalesCube(sales_frame)
+    counts = cube.rollup(cube.select(), ['Cliente/Nombre', 'Líneas de la orden'])
+    top = top_per_group(counts, 'Líneas')
+    expected = sales_frame.groupby('Cliente/Nombre', observed=True)['Líneas de la orden'].agg(
+        lambda products: products.astype(str).mode().iloc[0])
+    assert top.to_dict() == {str(client): product for client, product in expected.items()}